@@ -0,0 +1,48 @@
+"""
+Import throughput benchmark against the local fake EXAM server. Run it from the repository root:
+
+    PYTHONPATH=. python benchmarks/import_bench.py --sizes 10 100 1000 --jobs 1 8 --latency 0.01
+"""
+import argparse, contextlib, io, time
+from examtool import sdk, import_exam, sync_exam
+from examtool.transport import ExamSession
+from examtool.fake_server import FakeExamServer, synthetic_exam
+
+def bench(num_questions: int, jobs: int, latency: float, mode: str, error_rate: float = 0.0):
+    """
+    Imports a synthetic exam into a fresh fake server and returns `(seconds, requests)`.
+
+    In `sync` mode the exam is imported first and the measured run is a re-sync with one changed question.
+    """
+    exam = synthetic_exam(num_questions)
+    with FakeExamServer(latency=latency, error_rate=error_rate) as server:
+        sdk.base_url = server.url
+        exam_id = server.exam.add_exam()
+        client = ExamSession(pool_size=jobs, backoff=0.01)
+        with contextlib.redirect_stdout(io.StringIO()):
+            if mode == "sync":
+                import_exam(client, exam_id, 1, exam, jobs=jobs)
+                exam[0]["questions"][0]["html"] += "<p>changed</p>"
+            before = server.requests
+            start = time.perf_counter()
+            (sync_exam if mode == "sync" else import_exam)(client, exam_id, 1, exam, jobs=jobs)
+            seconds = time.perf_counter() - start
+        return seconds, server.requests - before
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark examtool import against the fake EXAM server.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help='Numbers of questions to import.')
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--latency', type=float, default=0.01, help='Server latency per request in seconds.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that the server fails with a 503.')
+    parser.add_argument('--mode', choices=['import', 'sync'], default='import')
+    args = parser.parse_args()
+
+    print(f"{'questions':>9} {'jobs':>4} {'seconds':>8} {'requests':>8} {'req/s':>8}")
+    for size in args.sizes:
+        for jobs in args.jobs:
+            seconds, requests = bench(size, jobs, args.latency, args.mode, args.error_rate)
+            print(f"{size:>9} {jobs:>4} {seconds:>8.2f} {requests:>8} {requests / seconds:>8.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Peak memory of downloading the question bank from the local fake EXAM server. Run it from the repository root:
+
+    PYTHONPATH=. python benchmarks/memory_bench.py --sizes 1000 10000
+
+Compares `get_questions`, which decodes the whole response at once, with streaming it through `iter_questions` one
+question at a time, and with keeping only the `id` and `tags` of every question. Also measures the question bank
+cache that `examtool import` uses by default, which keeps only the questions generated by examtool, and
+`mirror refresh`, which streams the whole bank into SQLite. One in ten questions is generated by examtool, as in a
+bank shared with people who write their questions by hand. Requests go through the same `ExamSession` with a
+`Recorder` installed that the CLI uses, so that its retries and profiling are measured too.
+"""
+import argparse, multiprocessing, os, tempfile, time, tracemalloc
+from examtool import sdk
+from examtool.cache import QuestionBank
+from examtool.fake_server import FakeExamServer
+from examtool.metrics import Recorder
+from examtool.mirror import Mirror
+from examtool.sdk import generated_tag, get_questions, iter_questions, mk_question_data
+from examtool.transport import ExamSession
+
+def fill(server, num_questions: int):
+    """
+    Adds `num_questions` questions with a paragraph of text and 4 options to the fake server's question bank, every
+    tenth of them generated by examtool.
+    """
+    for i in range(num_questions):
+        options = [{"option": f"Option {j + 1} of question {i + 1}", "correctOption": j == 0} for j in range(4)]
+        data = mk_question_data(1, 1, f"<p>Question {i + 1}: {'lorem ipsum ' * 40}</p>", options, [f"examtool_{i % 10}"])
+        if i % 10:
+            data["tags"] = [tag for tag in data["tags"] if tag["name"] != generated_tag]
+        server.exam.create_question(data)
+
+def serve(num_questions: int, urls, stop):
+    """
+    Runs a fake server with a question bank of `num_questions` in its own process, so that its memory is not measured.
+    """
+    with FakeExamServer() as server:
+        fill(server, num_questions)
+        urls.put(server.url)
+        stop.wait()
+
+def measure(f):
+    """
+    Returns `(seconds, peak MiB)` of calling `f`.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    f()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak / 2 ** 20
+
+def mirror_refresh(client):
+    with tempfile.TemporaryDirectory() as tmp, Mirror(os.path.join(tmp, "mirror.sqlite3")) as mirror:
+        return mirror.refresh(client, [], 4)["questions"]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the peak memory of downloading the question bank.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000], help='Numbers of questions in the bank.')
+    args = parser.parse_args()
+
+    variants = [
+        ("get_questions", lambda client: len(get_questions(client))),
+        ("iter_questions", lambda client: sum(1 for question in iter_questions(client))),
+        ("list id,tags", lambda client: len(list(iter_questions(client, ["id", "tags"])))),
+        ("question bank cache", lambda client: len(QuestionBank().with_tags(client, generated_tag))),
+        ("mirror refresh", mirror_refresh),
+    ]
+    print(f"{'questions':>9} {'variant':<24} {'seconds':>8} {'peak MiB':>8}")
+    for size in args.sizes:
+        urls, stop = multiprocessing.Queue(), multiprocessing.Event()
+        server = multiprocessing.Process(target=serve, args=(size, urls, stop))
+        server.start()
+        try:
+            sdk.base_url = urls.get()
+            client = Recorder().install(ExamSession())
+            for name, f in variants:
+                seconds, peak = measure(lambda: f(client))
+                print(f"{size:>9} {name:<24} {seconds:>8.2f} {peak:>8.1f}")
+        finally:
+            stop.set()
+            server.join()
+
+if __name__ == '__main__':
+    main()
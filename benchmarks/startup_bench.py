@@ -0,0 +1,79 @@
+"""
+Cold start benchmark of the `examtool` and `typst_exam` commands. Run it from the repository root:
+
+    PYTHONPATH=. python benchmarks/startup_bench.py --runs 20 --max-ms 150
+
+Every command runs in a fresh interpreter against the local fake EXAM server. Exits with status 1 if the median of a
+command is over `--max-ms`, or if a command imports a heavy module it does not need.
+"""
+import argparse, json, os, statistics, subprocess, sys, tempfile, time
+from examtool.fake_server import FakeExamServer
+
+heavy_modules = ["requests", "markdown"]
+
+# Runs a CLI entry point and reports the heavy modules it imported on stderr, after everything else it printed
+runner = """
+import atexit, importlib, json, sys
+atexit.register(lambda: print(json.dumps(sorted(m for m in sys.modules if m in %r)), file=sys.stderr))
+module, function = sys.argv[1].split(":")
+sys.argv = sys.argv[1:]
+try:
+    getattr(importlib.import_module(module), function)()
+except SystemExit:
+    pass
+""" % heavy_modules
+
+def commands(typst_path: str):
+    """
+    `(name, argv, heavy modules the command may import)` of the benchmarked commands.
+    """
+    return [
+        ("examtool -h", ["examtool.cli:main", "-h"], []),
+        ("examtool cache clear", ["examtool.cli:main", "cache", "clear"], []),
+        ("examtool get exams", ["examtool.cli:main", "get", "exams"], ["requests"]),
+        ("typst_exam -h", ["typst_exam:main", "-h"], []),
+        ("typst_exam FILE --no-cache", ["typst_exam:main", typst_path, "--no-cache"], ["markdown"]),
+    ]
+
+def run(argv: list, env: dict):
+    """
+    Runs the command in a fresh interpreter and returns `(seconds, heavy modules imported)`.
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", runner, *argv], env=env, capture_output=True, text=True, check=True)
+    seconds = time.perf_counter() - start
+    return seconds, json.loads(result.stderr.splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the cold start time of examtool and typst_exam.')
+    parser.add_argument('--runs', type=int, default=10, help='Number of runs of each command.')
+    parser.add_argument('--max-ms', type=float, default=None, help='Fail if the median start time of a command is over this.')
+    args = parser.parse_args()
+
+    failed = False
+    with FakeExamServer() as server, tempfile.TemporaryDirectory() as tmp:
+        server.exam.add_exam()
+        typst_path = os.path.join(tmp, "exam.typ")
+        with open(typst_path, "w") as f:
+            f.write("= Section\n== Question\n+ Yes (correct)\n+ No\n")
+        env = {**os.environ, "EXAM_URL": server.url, "XDG_CACHE_HOME": tmp}
+        env["PYTHONPATH"] = os.pathsep.join([os.getcwd()] + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else []))
+
+        print(f"{'command':<28} {'median ms':>9} {'min ms':>8}  heavy imports")
+        for name, argv, allowed in commands(typst_path):
+            results = [run(argv, env) for _ in range(args.runs)]
+            times = [seconds * 1000 for seconds, modules in results]
+            modules = results[-1][1]
+            median = statistics.median(times)
+            print(f"{name:<28} {median:>9.1f} {min(times):>8.1f}  {', '.join(modules) or '-'}")
+            unexpected = [module for module in modules if module not in allowed]
+            if unexpected:
+                print(f"  {name} should not import {', '.join(unexpected)}")
+                failed = True
+            if args.max_ms is not None and median > args.max_ms:
+                print(f"  {name} is slower than {args.max_ms} ms")
+                failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -14,7 +14,7 @@ rec {
     src = ./.;
     pyproject = true;
     checkPhase = ''
-      pytest -q typst_exam/test.py
+      pytest -q typst_exam/test.py examtool/test.py
     '';
     nativeBuildInputs = with pkgs.python3Packages; [
       pytest
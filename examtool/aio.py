@@ -0,0 +1,193 @@
+"""
+Async counterparts of the `examtool.sdk` functions, for embedding examtool in asyncio services.
+
+Every function takes an `AsyncExamSession` instead of a `requests.Session` and is otherwise called like its `sdk`
+namesake. Errors are the same: responses go through `sdk.handle_error_response`, and failed requests raise the
+`requests` exceptions, so code that handles SDK errors handles these too. Needs aiohttp, `pip install examtool[async]`.
+"""
+import asyncio
+import requests
+from requests.cookies import RequestsCookieJar
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from . import sdk
+from .sdk import handle_error_response, headers, mk_question_data, question_bank
+from .transport import ConnectFailedError, TokenBucket, is_retryable, is_retryable_error, retry_delay
+
+try:
+    import aiohttp
+except ImportError as err:
+    raise ImportError("the async SDK needs aiohttp, install it with `pip install examtool[async]`") from err
+
+def to_response(resp, body: bytes):
+    """
+    Turns an aiohttp response and its body into a `requests.Response`, for the error handling of `sdk`.
+    """
+    response = requests.Response()
+    response.status_code = resp.status
+    response.reason = resp.reason
+    response.url = str(resp.url)
+    response.headers = CaseInsensitiveDict(resp.headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = body
+    return response
+
+def to_request_error(err: Exception):
+    """
+    The `requests` exception matching an aiohttp or timeout error.
+    """
+    if isinstance(err, asyncio.TimeoutError):
+        return requests.Timeout(str(err) or "request timed out")
+    if isinstance(err, aiohttp.ClientConnectorError):
+        # Refused, unresolvable and the like: retried like the connect failures of `ExamSession`, also for POSTs
+        return ConnectFailedError(str(err))
+    if isinstance(err, aiohttp.ClientConnectionError):
+        return requests.ConnectionError(str(err))
+    return requests.RequestException(str(err))
+
+class AsyncExamSession:
+    """
+    A pooled aiohttp session for talking to EXAM from many coroutines, the counterpart of
+    `examtool.transport.ExamSession`.
+
+    - Keeps up to `pool_size` connections open; requests over that wait for a free connection.
+    - Sends at most `rate` requests per second on average, when given.
+    - Retries transient failures like `ExamSession`, up to `retries` times with exponential backoff.
+
+    `cookies` and `headers` work like those of a `requests.Session`, so `examtool.cli.init_client` sets them up too.
+    Use it as `async with AsyncExamSession() as client:`, or `await client.close()` when done.
+    """
+    def __init__(self, pool_size: int = 100, rate: float = None, burst: int = None, retries: int = 5, backoff: float = 0.5, max_backoff: float = 30, timeout: float = 60):
+        self.pool_size = pool_size
+        self.rate_limiter = TokenBucket(rate, burst) if rate else None
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.cookies = RequestsCookieJar()
+        self.headers = {}
+        self.session = None
+
+    def client_session(self):
+        # aiohttp sessions belong to the running event loop, so the session is created on first use
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size), cookies=self.cookies.get_dict(),
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def request(self, method: str, url: str, json=None, headers: dict = None):
+        """
+        Sends a request and returns its response as a `requests.Response`, with the body read.
+        """
+        for attempt in range(self.retries + 1):
+            if self.rate_limiter:
+                await asyncio.sleep(self.rate_limiter.reserve())
+            try:
+                async with self.client_session().request(method, url, json=json, headers={**self.headers, **(headers or {})}) as resp:
+                    response = to_response(resp, await resp.read())
+            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                error = to_request_error(err)
+                if attempt == self.retries or not is_retryable_error(method, error):
+                    raise error from err
+                await asyncio.sleep(retry_delay(attempt, self.backoff, self.max_backoff))
+                continue
+            if attempt == self.retries or not is_retryable(method, response):
+                return response
+            await asyncio.sleep(retry_delay(attempt, self.backoff, self.max_backoff, response))
+
+    async def get(self, url: str, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url: str, **kwargs):
+        return await self.request("PUT", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs):
+        return await self.request("DELETE", url, **kwargs)
+
+async def get_exams(client):
+    resp = await client.get(f'{sdk.base_url}/app/reviewerexams', headers=headers)
+    return handle_error_response(resp).json()
+
+async def get_exam(client, exam_id: int):
+    resp = await client.get(f'{sdk.base_url}/app/exams/{exam_id}', headers=headers)
+    return handle_error_response(resp).json()
+
+async def create_section(client, exam_id: int):
+    resp = await client.post(f'{sdk.base_url}/app/exams/{exam_id}/sections', headers=headers)
+    return handle_error_response(resp).json()
+
+async def edit_section(client, exam_id: int, section_id: int, name: str, description: str, lottery_on: bool = False, lottery_item_count: int = None):
+    resp = await client.put(f'{sdk.base_url}/app/exams/{exam_id}/sections/{section_id}', headers=headers, json={
+        "name": name,
+        "description": description,
+        "lotteryOn": lottery_on,
+        "lotteryItemCount": lottery_item_count,
+    })
+    return handle_error_response(resp).json()
+
+async def delete_section(client, exam_id: int, section_id: int):
+    resp = await client.delete(f'{sdk.base_url}/app/exams/{exam_id}/sections/{section_id}', headers=headers)
+    handle_error_response(resp)
+
+async def add_question(client, exam_id: int, section_id: int, sequence_number: int, question_id: int):
+    resp = await client.post(f'{sdk.base_url}/app/exams/{exam_id}/sections/{section_id}/questions', headers=headers, json={
+        "sequenceNumber": sequence_number,
+        "questions": str(question_id)
+    })
+    return handle_error_response(resp).json()
+
+async def remove_question(client, exam_id: int, section_id: int, question_id: int):
+    resp = await client.delete(f'{sdk.base_url}/app/exams/{exam_id}/sections/{section_id}/questions/{question_id}', headers=headers)
+    handle_error_response(resp)
+
+async def delete_question(client, question_id: int):
+    resp = await client.delete(f'{sdk.base_url}/app/questions/{question_id}', headers=headers)
+    handle_error_response(resp)
+    if question_bank(client):
+        question_bank(client).discard(question_id)
+
+async def get_questions(client):
+    resp = await client.get(f'{sdk.base_url}/app/questions', headers=headers)
+    return handle_error_response(resp).json()
+
+async def edit_question(client, question_id: int, owner_id: int, default_max_score: int, question: str, options: list, tags=[]):
+    """
+    See `sdk.edit_question`.
+    """
+    resp = await client.put(f'{sdk.base_url}/app/questions/{question_id}', headers=headers, json=mk_question_data(owner_id, default_max_score, question, options, tags))
+    result = handle_error_response(resp).json()
+    if question_bank(client):
+        question_bank(client).put(result)
+    return result
+
+async def create_question(client, owner_id: int, default_max_score: int, question: str, options: list, tags=[]):
+    """
+    See `sdk.create_question`, including its caveat about URI sensitive characters in the options.
+    """
+    resp = await client.post(f'{sdk.base_url}/app/questions', headers=headers, json=mk_question_data(owner_id, default_max_score, question, options, tags))
+    result = handle_error_response(resp).json()
+    if question_bank(client):
+        question_bank(client).put(result)
+    return result
+
+async def fetch_exams(client, exam_ids: list):
+    """
+    Gets the exams concurrently, as many at a time as the session has connections. Returns them in the order of
+    `exam_ids`.
+    """
+    return await asyncio.gather(*(get_exam(client, exam_id) for exam_id in exam_ids))
@@ -0,0 +1,114 @@
+import json, os, threading, time
+from .paths import server_cache_path
+from .sdk import generated_tag, iter_questions
+
+def default_cache_path():
+    """
+    Cache file for the question bank of `sdk.base_url`.
+    """
+    return server_cache_path("questions", ".json")
+
+class QuestionBank:
+    """
+    Local copy of the questions generated by examtool, the ones tagged `sdk.generated_tag`, keyed by question ID with
+    a tag name -> question IDs index.
+
+    The whole bank is streamed with `iter_questions` only when the copy is older than `ttl` seconds, and only the
+    generated questions are kept, so that memory and the saved file scale with those instead of the whole bank. Attach
+    it to the client as `client.question_bank` and the SDK keeps it up to date when questions are created, edited or
+    deleted. With a `path`, the copy is loaded from and saved to that file so that it survives between runs.
+    """
+    def __init__(self, path: str = None, ttl: float = 600):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.questions = {}
+        self.by_tag = {}
+        self.fetched_at = None
+        if path and os.path.exists(path):
+            self.load()
+
+    def index(self, question: dict):
+        if not any(tag["name"] == generated_tag for tag in question.get("tags", [])):
+            return
+        self.questions[question["id"]] = question
+        for tag in question.get("tags", []):
+            self.by_tag.setdefault(tag["name"], set()).add(question["id"])
+
+    def discard(self, question_id: int):
+        with self.lock:
+            question = self.questions.pop(question_id, None)
+            for tag in question.get("tags", []) if question else []:
+                ids = self.by_tag.get(tag["name"])
+                if ids is not None:
+                    ids.discard(question_id)
+                    if not ids:
+                        del self.by_tag[tag["name"]]
+
+    def put(self, question: dict):
+        """
+        Adds or replaces a question, e.g. from the response of a create or edit. Questions that are not generated by
+        examtool are only dropped.
+        """
+        with self.lock:
+            self.discard(question["id"])
+            self.index(question)
+
+    def is_fresh(self):
+        return self.fetched_at is not None and time.time() - self.fetched_at < self.ttl
+
+    def refresh(self, client):
+        """
+        Replaces the copy with the question bank downloaded from EXAM.
+        """
+        with self.lock:
+            self.questions = {}
+            self.by_tag = {}
+            self.fetched_at = None
+            # Indexed while downloading, without holding the whole response or the questions of others
+            for question in iter_questions(client):
+                self.index(question)
+            self.fetched_at = time.time()
+
+    def invalidate(self):
+        """
+        Forgets everything, so that the next lookup downloads the question bank again.
+        """
+        with self.lock:
+            self.questions = {}
+            self.by_tag = {}
+            self.fetched_at = None
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+    def with_tags(self, client, *tags: str):
+        """
+        Returns all generated questions that have every one of `tags`, downloading the question bank first if the copy is
+        stale.
+        """
+        with self.lock:
+            if not self.is_fresh():
+                self.refresh(client)
+            ids = set.intersection(*(self.by_tag.get(tag, set()) for tag in tags)) if tags else set(self.questions)
+            return [self.questions[id] for id in sorted(ids)]
+
+    def load(self):
+        with open(self.path) as f:
+            data = json.load(f)
+        with self.lock:
+            self.questions = {}
+            self.by_tag = {}
+            for question in data["questions"]:
+                self.index(question)
+            self.fetched_at = data["fetched_at"]
+
+    def save(self):
+        if not self.path or self.fetched_at is None:
+            return
+        with self.lock:
+            data = {"fetched_at": self.fetched_at, "questions": list(self.questions.values())}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
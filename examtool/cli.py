@@ -0,0 +1,389 @@
+"""
+The `examtool` command line interface.
+
+Commands are registered in the `commands` table with `@command`. Only the standard library is imported up front: the
+SDK, and with it `requests`, is loaded by the commands that talk to EXAM, so that e.g. `examtool -h` starts fast.
+"""
+import argparse, contextlib, json, os, sys
+
+def mitmproxy_session():
+    import requests
+    s = requests.Session()
+    s.proxies.update({"https": "https://localhost:8080"})
+    s.verify = False
+    return s
+
+def cookies_from_env(env_name):
+    cookies = {}
+    for cookie in os.environ.get(env_name, "").split(';'):
+        if '=' in cookie:
+            key, value = cookie.strip().split('=', 1)
+            cookies[key] = value
+    return cookies
+
+def init_client(client):
+    cookies = cookies_from_env("EXAM_COOKIE")
+    for key, value in cookies.items():
+        client.cookies.set(key, value)
+    client.headers.update({"X-XSRF-TOKEN": cookies.get("XSRF-TOKEN", "")})
+    return client
+
+def print_json(data):
+    print(json.dumps(data))
+
+def print_json_array(items):
+    """
+    Prints the items as one JSON array like `print_json`, but one item at a time.
+    """
+    sys.stdout.write("[")
+    for i, item in enumerate(items):
+        sys.stdout.write((", " if i else "") + json.dumps(item))
+    sys.stdout.write("]\n")
+
+def add_fields_argument(subparser):
+    subparser.add_argument('--fields', type=lambda fields: fields.split(','), default=None, help='Comma separated keys to keep of each object, e.g. `id,tags`. By default everything is kept.')
+
+def add_exam_id_argument(subparser):
+    subparser.add_argument('exam_id', type=int, help='This can be found from the URL of the webpage when editing an exam.')
+
+def add_section_id_argument(subparser):
+    subparser.add_argument('section_id', type=int, help='This is the ID of the section (aihealue) in an exam. This can be found under `examSections` whe getting an exam.')
+
+def add_question_id_argument(subparser):
+    subparser.add_argument('question_id', type=int, help='This is the ID of the question in a section.')
+
+def add_owner_id_argument(subparser):
+    subparser.add_argument('owner_id', type=int, help='This is the ID of the owner of the exercise. This can be found by e.g. getting all exams.')
+
+def add_jobs_argument(subparser):
+    subparser.add_argument('-j', '--jobs', type=int, default=4, help='Maximum number of concurrent requests to EXAM (default: %(default)s).')
+
+def add_question_data_arguments(subparser):
+    subparser.add_argument('default_max_score', type=int)
+    subparser.add_argument('question', type=str)
+    subparser.add_argument('options', type=json.loads)
+    subparser.add_argument('--tags', type=json.loads, required=False, default=[])
+
+def argument(*args, **kwargs):
+    """
+    Returns an argument adder for `@command` from the arguments of `add_argument`.
+    """
+    return lambda subparser: subparser.add_argument(*args, **kwargs)
+
+@contextlib.contextmanager
+def cached_question_bank(client, args):
+    """
+    Attaches the local copy of the question bank to the client for the duration of a command, unless `--cache-ttl` is
+    0, and saves it when the command is done.
+    """
+    if args.cache_ttl <= 0:
+        yield None
+        return
+    from .cache import QuestionBank, default_cache_path
+    client.question_bank = QuestionBank(default_cache_path(), args.cache_ttl)
+    try:
+        yield client.question_bank
+    finally:
+        client.question_bank.save()
+
+# Verbs in the order they are listed in the help, with their help text
+verbs = {
+    'get': 'Get information about an EXAM object, or objects.',
+    'add': 'Add objects to an exam. Use the remove subcommand to remove them.',
+    'edit': 'Edit an EXAM object. Usually completely replaces the old object with the new information.',
+    'remove': 'Remove an object from an exam. Removing differs from deleting as it does not delete the information in the object, but "unlinks" it instead.',
+    'delete': 'Permanently delete an object. Deleting differs from removing as it deletes the object and removes it from all assoaciated objects too.',
+    'create': 'Create new objects. Use the delete subcommand to permanently delete them.',
+    'import': 'Import an exam from a JSON file. This will **nuke** the exam first! Lottery is disabled and questions score 1 point by default. Notice that lottery is available only if all points within a section are equal.',
+    'export': 'Export exams into EaC IR files that can be imported again. The exported exams are also stored in the local mirror.',
+    'mirror': 'Manage and search the local SQLite mirror of exams and the question bank.',
+    'gc': 'Delete the questions generated by examtool that no exam uses any more, e.g. after an interrupted import.',
+    'cache': 'Manage the local copy of the question bank used by import.',
+}
+
+# (verb, subject) -> (handler, argument adders, help, whether the handler needs a client)
+commands = {}
+
+def command(verb: str, subject: str = None, arguments: list = (), help: str = None, client: bool = True):
+    """
+    Registers the decorated function as `examtool <verb> [<subject>]`.
+
+    The function is called with the client and the parsed arguments, or only with the arguments if `client` is false.
+    `arguments` are functions that add the command's arguments to its parser.
+    """
+    def register(handler):
+        commands[(verb, subject)] = (handler, arguments, help, client)
+        return handler
+    return register
+
+@command('get', 'exams', [add_fields_argument])
+def get_exams_command(client, args):
+    from .sdk import iter_exams
+    print_json_array(iter_exams(client, args.fields))
+
+@command('get', 'exam', [add_exam_id_argument])
+def get_exam_command(client, args):
+    from .sdk import get_exam
+    print_json(get_exam(client, args.exam_id))
+
+@command('get', 'questions', [add_fields_argument])
+def get_questions_command(client, args):
+    from .sdk import iter_questions
+    print_json_array(iter_questions(client, args.fields))
+
+@command('add', 'question', [add_exam_id_argument, add_section_id_argument, argument('sequence_number', type=int), add_question_id_argument])
+def add_question_command(client, args):
+    from .sdk import add_question
+    print_json(add_question(client, args.exam_id, args.section_id, args.sequence_number, args.question_id))
+
+@command('edit', 'section', [
+    add_exam_id_argument,
+    add_section_id_argument,
+    argument('name', type=str),
+    argument('description', type=str),
+    argument('--lottery-on', action='store_true'),
+    argument('--lottery-item-count', type=int, required=False),
+])
+def edit_section_command(client, args):
+    from .sdk import edit_section
+    print_json(edit_section(client, args.exam_id, args.section_id, args.name, args.description, args.lottery_on, args.lottery_item_count))
+
+@command('edit', 'question', [add_question_id_argument, add_owner_id_argument, add_question_data_arguments])
+def edit_question_command(client, args):
+    from .sdk import edit_question
+    print_json(edit_question(client, args.question_id, args.owner_id, args.default_max_score, args.question, args.options, args.tags))
+
+@command('remove', 'question', [add_exam_id_argument, add_section_id_argument, add_question_id_argument])
+def remove_question_command(client, args):
+    from .sdk import remove_question
+    remove_question(client, args.exam_id, args.section_id, args.question_id)
+
+@command('delete', 'section', [add_exam_id_argument, add_section_id_argument])
+def delete_section_command(client, args):
+    from .sdk import delete_section
+    delete_section(client, args.exam_id, args.section_id)
+
+@command('delete', 'question', [add_question_id_argument])
+def delete_question_command(client, args):
+    from .sdk import delete_question
+    delete_question(client, args.question_id)
+
+@command('create', 'section', [add_exam_id_argument])
+def create_section_command(client, args):
+    from .sdk import create_section
+    print_json(create_section(client, args.exam_id))
+
+@command('create', 'question', [add_owner_id_argument, add_question_data_arguments])
+def create_question_command(client, args):
+    from .sdk import create_question
+    print_json(create_question(client, args.owner_id, args.default_max_score, args.question, args.options, args.tags))
+
+@command('import', None, [
+    add_exam_id_argument,
+    add_owner_id_argument,
+    argument('file', type=str, help='EaC IR as JSON, or as JSON Lines with a record per section and question and a final end record. `-` reads it from the standard input, e.g. from `typst_exam --jsonl`.'),
+    argument('--sync', action='store_true', help='Do not nuke the exam. Instead, only create, edit, remove and delete what differs from the JSON file, keeping the IDs of unchanged questions.'),
+    argument('--resume', action='store_true', help='Continue an import that was interrupted, e.g. by expired cookies, from where it stopped instead of starting over. Not needed with --sync, which can simply be run again.'),
+    argument('--journal', type=str, default=None, help='File in which the completed steps of the import are recorded for --resume. By default it is kept in the cache directory and removed once the import finishes.'),
+    add_jobs_argument,
+    argument('--also', type=int, action='append', default=[], metavar='EXAM_ID', help='Import also into this exam, e.g. another sitting. Every question is created once and added to all of the exams. Can be given many times, but not with --sync or --resume.'),
+    argument('--dry-run', action='store_true', help='Only print the requests the import would send, what each of them waits for, and an estimate of how long they take. Nothing is changed in EXAM.'),
+    argument('--latencies', type=str, default=None, metavar='FILE', help='Endpoint latencies for the --dry-run estimate, e.g. a --profile-trace file. By default the latencies measured during earlier imports are used.'),
+    argument('--watch', action='store_true', help='Treat the file as typst EXAM source and keep running, syncing the exam like --sync every time the file is saved. Stop with Ctrl-C.'),
+    argument('--debounce', type=float, default=0.5, help='With --watch, seconds to wait for further saves before syncing (default: %(default)s).'),
+])
+def import_command(client, args):
+    from concurrent.futures import ThreadPoolExecutor
+    from .importer import import_exam, import_exams, sync_exam
+    from .ir import ExamValidationError, read_exam
+    from .journal import Journal, JournalError, default_journal_path
+    from .metrics import Recorder, default_latencies_path, save_latencies
+
+    if args.watch and (args.also or args.resume or args.dry_run):
+        args.parser.error("--watch cannot be used with --also, --resume or --dry-run")
+    if args.sync and args.resume:
+        args.parser.error("--resume cannot be used with --sync, run the sync again instead")
+    if args.also and (args.sync or args.resume):
+        args.parser.error("--also cannot be used with --sync or --resume")
+
+    with cached_question_bank(client, args) as bank:
+        # Measured latencies of the real imports make the estimates of dry runs
+        recorder = Recorder()
+        recorder.install(client)
+        if not args.watch:
+            # The question bank downloads while the IR is read, which may take long when it is piped from its producer
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                if bank:
+                    pool.submit(bank.with_tags, client)
+                try:
+                    with (contextlib.nullcontext(sys.stdin) if args.file == '-' else open(args.file)) as f:
+                        exam = read_exam(f)
+                except ExamValidationError as err:
+                    args.parser.error(f"{args.file} is not valid EaC IR:\n{err}")
+        try:
+            if args.watch:
+                from typst_exam.render import HtmlRenderer, default_cache_path as default_html_cache_path
+                from .watch import watch_exam
+                with HtmlRenderer(default_html_cache_path()) as renderer:
+                    watch_exam(client, args.exam_id, args.owner_id, args.file, args.jobs, args.debounce, render=renderer.render)
+            elif args.dry_run:
+                dry_run(client, args, exam)
+            elif args.sync:
+                sync_exam(client, args.exam_id, args.owner_id, exam, jobs=args.jobs)
+            elif args.also:
+                import_exams(client, [args.exam_id, *args.also], args.owner_id, exam, jobs=args.jobs)
+            else:
+                journal_path = args.journal or default_journal_path(args.exam_id)
+                try:
+                    journal = (Journal.resume if args.resume else Journal.start)(journal_path, args.exam_id, exam)
+                except JournalError as err:
+                    args.parser.error(str(err))
+                try:
+                    import_exam(client, args.exam_id, args.owner_id, exam, jobs=args.jobs, journal=journal)
+                except BaseException:
+                    journal.close()
+                    print("The import was interrupted. Fix the problem and continue it with --resume.")
+                    raise
+                journal.remove()
+        finally:
+            if recorder.records and not args.dry_run:
+                save_latencies(default_latencies_path(), recorder.summary())
+
+def dry_run(client, args, exam):
+    """
+    Prints the plan of the import without changing anything in EXAM.
+    """
+    from .journal import Journal, JournalError, default_journal_path
+    from .metrics import default_latencies_path, load_latencies
+    from .planner import plan_import, plan_sync
+
+    if args.sync:
+        plan = plan_sync(client, args.exam_id, args.owner_id, exam)
+    else:
+        journal = None
+        if args.resume:
+            try:
+                journal = Journal.resume(args.journal or default_journal_path(args.exam_id), args.exam_id, exam)
+            except JournalError as err:
+                args.parser.error(str(err))
+        plan = plan_import(client, [args.exam_id, *args.also], args.owner_id, exam, journal, args.jobs)
+        if journal:
+            journal.close()
+    plan.print(load_latencies(args.latencies or default_latencies_path()), args.jobs, args.rate)
+
+@command('export', None, [
+    argument('exam_ids', type=int, nargs='+', metavar='exam_id', help='This can be found from the URL of the webpage when editing an exam.'),
+    argument('-o', '--output-dir', type=str, default=None, help='Write each exam into `<exam_id>.json` in this directory. Required when exporting several exams, otherwise the EaC IR is printed.'),
+    argument('--no-mirror', action='store_true', help='Do not store the exported exams in the local mirror.'),
+    add_jobs_argument,
+])
+def export_command(client, args):
+    from .exporter import fetch_exams, exam_to_ir
+    from .mirror import Mirror
+
+    if len(args.exam_ids) > 1 and not args.output_dir:
+        args.parser.error("--output-dir is required when exporting several exams")
+    exams = fetch_exams(client, args.exam_ids, args.jobs)
+    if not args.no_mirror:
+        with Mirror() as mirror:
+            mirror.update(exams)
+    if not args.output_dir:
+        print(json.dumps(exam_to_ir(exams[0]), indent=2))
+        return
+    os.makedirs(args.output_dir, exist_ok=True)
+    for exam_id, exam in zip(args.exam_ids, exams):
+        path = os.path.join(args.output_dir, f"{exam_id}.json")
+        with open(path, "w") as f:
+            json.dump(exam_to_ir(exam), f, indent=2)
+        print(f"Exported exam {exam_id} -> {path}")
+
+@command('mirror', 'refresh', [
+    argument('exam_ids', type=int, nargs='*', metavar='exam_id', help='Exams to download. By default all exams are downloaded and the ones no longer listed are dropped.'),
+    add_jobs_argument,
+], help='Download exams and the question bank, and store what changed in the mirror.')
+def mirror_refresh_command(client, args):
+    from .mirror import Mirror
+    with Mirror() as mirror:
+        stats = mirror.refresh(client, args.exam_ids or None, args.jobs)
+    print(f"Updated {stats['exams']} exams and {stats['questions']} questions, deleted {stats['deleted']} questions")
+
+@command('mirror', 'search', [
+    argument('text', type=str, nargs='?', default='', help='Text that the HTML of the question contains, ignoring case.'),
+    argument('--tag', type=str, action='append', default=[], help='Only questions with this tag. Can be given many times.'),
+], help='Print the mirrored questions that match as JSON.', client=False)
+def mirror_search_command(args):
+    from .mirror import Mirror
+    with Mirror() as mirror:
+        print_json(mirror.search(args.text, args.tag))
+
+@command('gc', None, [
+    argument('--dry-run', action='store_true', help='Print the orphaned questions as JSON instead of deleting them.'),
+    add_jobs_argument,
+])
+def gc_command(client, args):
+    from .importer import collect_garbage
+    with cached_question_bank(client, args):
+        questions = collect_garbage(client, args.jobs, args.dry_run)
+    if args.dry_run:
+        print_json(questions)
+    else:
+        print(f"Deleted {len(questions)} orphaned questions")
+
+@command('cache', 'clear', help='Forget the local copy, so that the next import downloads the question bank again.', client=False)
+def cache_clear_command(args):
+    from .cache import QuestionBank, default_cache_path
+    QuestionBank(default_cache_path()).invalidate()
+
+def make_parser():
+    parser = argparse.ArgumentParser(description='Exam Manager CLI')
+    parser.add_argument('--cache-ttl', type=float, default=600, help='Seconds for which the local copy of the question bank is trusted before it is downloaded again. 0 disables the cache (default: %(default)s).')
+    parser.add_argument('--rate', type=float, default=None, help='Maximum average number of requests per second sent to EXAM. Unlimited by default.')
+    parser.add_argument('--retries', type=int, default=5, help='How many times transient errors, such as 503 responses and connection errors, are retried (default: %(default)s).')
+    parser.add_argument('--profile', action='store_true', help='Print the count and p50, p95 and max latency of the requests to each endpoint to stderr when done.')
+    parser.add_argument('--profile-trace', type=str, default=None, metavar='FILE', help='Write every request and the per-endpoint summary into a JSON trace file.')
+    subparsers = parser.add_subparsers(dest='verb', required=True)
+
+    for verb, help in verbs.items():
+        parser_verb = subparsers.add_parser(verb, help=help)
+        if (verb, None) in commands:
+            for add_argument in commands[(verb, None)][1]:
+                add_argument(parser_verb)
+            continue
+        verb_subparsers = parser_verb.add_subparsers(dest='subject', required=True)
+        for (command_verb, subject), (handler, arguments, help, client) in commands.items():
+            if command_verb == verb:
+                parser_subject = verb_subparsers.add_parser(subject, help=help)
+                for add_argument in arguments:
+                    add_argument(parser_subject)
+    return parser
+
+def make_client(args):
+    from .transport import ExamSession
+    client = init_client(ExamSession(pool_size=max(10, getattr(args, 'jobs', 0)), rate=args.rate, retries=args.retries))
+    # client = init_client(mitmproxy_session())
+    return client
+
+def main():
+    parser = make_parser()
+    args = parser.parse_args()
+    args.parser = parser
+    handler, arguments, help, needs_client = commands[(args.verb, getattr(args, 'subject', None))]
+    if not needs_client:
+        return handler(args)
+
+    client = make_client(args)
+    recorder = None
+    if args.profile or args.profile_trace:
+        from .metrics import Recorder
+        recorder = Recorder()
+        recorder.install(client)
+    try:
+        handler(client, args)
+    finally:
+        if recorder and args.profile:
+            recorder.report()
+        if recorder and args.profile_trace:
+            recorder.dump(args.profile_trace)
+
+if __name__ == '__main__':
+    main()
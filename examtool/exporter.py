@@ -0,0 +1,48 @@
+from concurrent.futures import ThreadPoolExecutor
+from .sdk import *
+
+def question_to_ir(question: dict):
+    """
+    Converts a question bank entry into an EaC IR question.
+    """
+    options = []
+    for op in question["options"]:
+        option = {"option": op["option"], "correctOption": bool(op.get("correctOption"))}
+        if op.get("defaultScore"):
+            option["defaultScore"] = op["defaultScore"]
+        options.append(option)
+    return {"html": question["question"], "points": question.get("defaultMaxScore", 1), "options": options}
+
+def section_to_ir(section: dict):
+    """
+    Converts a section of `get_exam` into an EaC IR section, with its questions in sequence number order.
+    """
+    section_questions = sorted(section.get("sectionQuestions", []), key=lambda sq: sq["sequenceNumber"])
+    ir = {
+        "name": section.get("name") or "",
+        "description": section.get("description") or "",
+        "questions": [question_to_ir(sq["question"]) for sq in section_questions],
+    }
+    if section.get("lotteryOn"):
+        ir["lotteryOn"] = True
+        ir["lotteryItemCount"] = section["lotteryItemCount"]
+    return ir
+
+def exam_to_ir(exam: dict):
+    """
+    Converts an exam of `get_exam` into the EaC IR accepted by `validate_exam` and `import_exam`.
+    """
+    return [section_to_ir(section) for section in sorted(exam["examSections"], key=lambda section: section["sequenceNumber"])]
+
+def fetch_exams(client, exam_ids: list, jobs: int = 1):
+    """
+    Gets the exams with `get_exam`, running at most `jobs` requests at a time. Returns them in the order of `exam_ids`.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        return list(pool.map(lambda exam_id: get_exam(client, exam_id), exam_ids))
+
+def export_exams(client, exam_ids: list, jobs: int = 1):
+    """
+    Returns the EaC IR of each of the exams `exam_ids`, by exam ID.
+    """
+    return {exam_id: exam_to_ir(exam) for exam_id, exam in zip(exam_ids, fetch_exams(client, exam_ids, jobs))}
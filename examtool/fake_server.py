@@ -0,0 +1,319 @@
+"""
+A local stand-in for the EXAM endpoints used by `examtool.sdk`, for testing and benchmarking without the real server.
+
+Run `python -m examtool.fake_server` and point the SDK to it with `EXAM_URL=http://localhost:8000`.
+"""
+import json, random, re, threading, time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, urlsplit
+
+def mangle(text: str):
+    """
+    Mimics the platform URI encoding the options of created questions.
+    """
+    return quote(text, safe=" ")
+
+class FakeExam:
+    """
+    In-memory state of the fake EXAM. All methods return `(status, body)` and must be called with `lock` held.
+    """
+    def __init__(self, mangle_options: bool = True):
+        self.lock = threading.Lock()
+        self.mangle_options = mangle_options
+        self.next_id = 1
+        self.exams = {}
+        self.questions = {}
+        self.tags = {}
+
+    def new_id(self):
+        id = self.next_id
+        self.next_id += 1
+        return id
+
+    def add_exam(self, name: str = "Fake exam", owner_id: int = 1):
+        with self.lock:
+            id = self.new_id()
+            self.exams[id] = {"id": id, "name": name, "examOwners": [{"id": owner_id}], "examSections": []}
+            return id
+
+    def section(self, exam_id: int, section_id: int):
+        exam = self.exams.get(exam_id)
+        for section in exam["examSections"] if exam else []:
+            if section["id"] == section_id:
+                return section
+        return None
+
+    def get_exams(self, body):
+        return 200, [{key: value for key, value in exam.items() if key != "examSections"} for exam in self.exams.values()]
+
+    def get_exam(self, body, exam_id):
+        if exam_id not in self.exams:
+            return 404, "exam not found"
+        exam = self.exams[exam_id]
+        return 200, {**exam, "examSections": [
+            {**section, "sectionQuestions": [
+                {"id": sq["id"], "sequenceNumber": sq["sequenceNumber"], "question": self.questions[sq["question"]]}
+                for sq in section["sectionQuestions"]
+            ]}
+            for section in exam["examSections"]
+        ]}
+
+    def create_section(self, body, exam_id):
+        if exam_id not in self.exams:
+            return 404, "exam not found"
+        sections = self.exams[exam_id]["examSections"]
+        section = {"id": self.new_id(), "sequenceNumber": len(sections), "name": None, "description": None,
+                   "lotteryOn": False, "lotteryItemCount": 0, "sectionQuestions": []}
+        sections.append(section)
+        return 200, {key: value for key, value in section.items() if key != "sectionQuestions"}
+
+    def edit_section(self, body, exam_id, section_id):
+        section = self.section(exam_id, section_id)
+        if section is None:
+            return 404, "section not found"
+        section.update(name=body["name"], description=body["description"], lotteryOn=body["lotteryOn"],
+                       lotteryItemCount=body["lotteryItemCount"] or 1)
+        return 200, {key: value for key, value in section.items() if key != "sectionQuestions"}
+
+    def delete_section(self, body, exam_id, section_id):
+        section = self.section(exam_id, section_id)
+        if section is None:
+            return 404, "section not found"
+        sections = self.exams[exam_id]["examSections"]
+        sections.remove(section)
+        for i, section in enumerate(sections):
+            section["sequenceNumber"] = i
+        return 200, None
+
+    def add_question(self, body, exam_id, section_id):
+        section = self.section(exam_id, section_id)
+        if section is None:
+            return 404, "section not found"
+        sequence_number = body["sequenceNumber"]
+        for question_id in map(int, str(body["questions"]).split(",")):
+            if question_id not in self.questions:
+                return 404, "question not found"
+            if any(sq["question"] == question_id for sq in section["sectionQuestions"]):
+                return 400, "sitnet_question_already_in_section"
+            # Same as EXAM: clamp the sequence number and shift the questions at and after it
+            sequence_number = min(max(0, sequence_number), len(section["sectionQuestions"]))
+            for sq in section["sectionQuestions"]:
+                if sq["sequenceNumber"] >= sequence_number:
+                    sq["sequenceNumber"] += 1
+            section["sectionQuestions"].append({"id": self.new_id(), "sequenceNumber": sequence_number, "question": question_id})
+            section["sectionQuestions"].sort(key=lambda sq: sq["sequenceNumber"])
+            sequence_number += 1
+        return 200, {key: value for key, value in section.items() if key != "sectionQuestions"}
+
+    def unlink_question(self, section, question_id):
+        section["sectionQuestions"] = [sq for sq in section["sectionQuestions"] if sq["question"] != question_id]
+        for i, sq in enumerate(section["sectionQuestions"]):
+            sq["sequenceNumber"] = i
+
+    def remove_question(self, body, exam_id, section_id, question_id):
+        section = self.section(exam_id, section_id)
+        if section is None:
+            return 404, "section not found"
+        self.unlink_question(section, question_id)
+        return 200, None
+
+    def get_questions(self, body):
+        return 200, list(self.questions.values())
+
+    def question_from(self, body, id, old_options=()):
+        old_ids = {option["id"] for option in old_options}
+        options = []
+        for option in body["options"]:
+            option = {**option, "id": option["id"] if option.get("id") in old_ids else self.new_id()}
+            options.append(option)
+        return {
+            "id": id,
+            "type": body["type"],
+            "defaultMaxScore": body["defaultMaxScore"],
+            "question": body["question"],
+            "questionOwners": body["questionOwners"],
+            "tags": [{"id": self.tag_id(tag["name"]), "name": tag["name"]} for tag in body["tags"]],
+            "options": options,
+        }
+
+    def tag_id(self, name):
+        # Tags are shared between questions, like in EXAM
+        if name not in self.tags:
+            self.tags[name] = self.new_id()
+        return self.tags[name]
+
+    def create_question(self, body):
+        question = self.question_from(body, self.new_id())
+        if self.mangle_options:
+            for option in question["options"]:
+                option["option"] = mangle(option["option"])
+        self.questions[question["id"]] = question
+        return 200, question
+
+    def edit_question(self, body, question_id):
+        if question_id not in self.questions:
+            return 404, "question not found"
+        question = self.question_from(body, question_id, self.questions[question_id]["options"])
+        self.questions[question_id] = question
+        return 200, question
+
+    def delete_question(self, body, question_id):
+        if question_id not in self.questions:
+            return 404, "question not found"
+        del self.questions[question_id]
+        for exam in self.exams.values():
+            for section in exam["examSections"]:
+                self.unlink_question(section, question_id)
+        return 200, None
+
+# (method, path pattern, FakeExam method name); the endpoint name used in statistics is the pattern
+routes = [
+    ("GET", r"/app/reviewerexams", "get_exams"),
+    ("GET", r"/app/exams/(\d+)", "get_exam"),
+    ("POST", r"/app/exams/(\d+)/sections", "create_section"),
+    ("PUT", r"/app/exams/(\d+)/sections/(\d+)", "edit_section"),
+    ("DELETE", r"/app/exams/(\d+)/sections/(\d+)", "delete_section"),
+    ("POST", r"/app/exams/(\d+)/sections/(\d+)/questions", "add_question"),
+    ("DELETE", r"/app/exams/(\d+)/sections/(\d+)/questions/(\d+)", "remove_question"),
+    ("GET", r"/app/questions", "get_questions"),
+    ("POST", r"/app/questions", "create_question"),
+    ("PUT", r"/app/questions/(\d+)", "edit_question"),
+    ("DELETE", r"/app/questions/(\d+)", "delete_question"),
+]
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send headers and body in one packet, otherwise Nagle's algorithm adds ~40 ms to every keep-alive request
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, status: int, body):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_any(self):
+        server = self.server.fake
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        path = urlsplit(self.path).path
+
+        for method, pattern, name in routes:
+            match = re.fullmatch(pattern, path)
+            if method == self.command and match:
+                break
+        else:
+            server.count(f"{self.command} {path}")
+            return self.send(404, "no such endpoint")
+
+        server.count(f"{method} {pattern}")
+        if server.latency:
+            time.sleep(server.latency)
+        if server.should_fail():
+            return self.send(server.error_status, "injected error")
+        with server.exam.lock:
+            status, response = getattr(server.exam, name)(body, *map(int, match.groups()))
+        self.send(status, response)
+
+    do_GET = do_POST = do_PUT = do_DELETE = handle_any
+
+class FakeExamServer:
+    """
+    Serves a `FakeExam` over HTTP from a background thread.
+
+    `latency` seconds are slept before handling each request, and a `error_rate` fraction of the requests fail with
+    `error_status` without being processed.
+    Use as a context manager, and point `examtool.sdk.base_url` to `url`.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, error_rate: float = 0.0, error_status: int = 503, seed=None, mangle_options: bool = True):
+        self.exam = FakeExam(mangle_options)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.counts = Counter()
+        self.counts_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self):
+        return sum(self.counts.values())
+
+    def count(self, endpoint: str):
+        with self.counts_lock:
+            self.counts[endpoint] += 1
+
+    def should_fail(self):
+        with self.counts_lock:
+            return self.error_rate > 0 and self.random.random() < self.error_rate
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def synthetic_exam(num_questions: int, questions_per_section: int = 10, num_options: int = 4):
+    """
+    Generates an EaC IR exam with `num_questions` multiple choice questions.
+    """
+    exam = []
+    for start in range(0, num_questions, questions_per_section):
+        exam.append({
+            "name": f"Section {len(exam) + 1}",
+            "description": "",
+            "questions": [
+                {
+                    "html": f"<p>Question {i + 1}</p>",
+                    "options": [{"option": f"Option {j + 1}", "correctOption": j == 0} for j in range(num_options)],
+                }
+                for i in range(start, min(start + questions_per_section, num_questions))
+            ],
+        })
+    return exam
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Local stand-in for the EXAM endpoints used by examtool.')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to sleep before handling each request.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail with a 503.')
+    parser.add_argument('--exams', type=int, default=1, help='Number of empty exams to create.')
+    args = parser.parse_args()
+
+    server = FakeExamServer(args.host, args.port, args.latency, args.error_rate)
+    for i in range(args.exams):
+        print(f"Created exam {server.exam.add_exam(f'Fake exam {i + 1}')}")
+    print(f"Serving on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,408 @@
+import hashlib, json, re, threading
+from concurrent.futures import ThreadPoolExecutor
+from .sdk import *
+from .exporter import question_to_ir
+from .ir import ExamValidationError, load_exam
+
+hash_tag_prefix = "examtool_sha_"
+exam_tag_pattern = re.compile(r"examtool_([0-9]+)")
+
+class Progress:
+    """
+    Thread-safe "Doing thing i/n" printer shared by the import workers.
+    """
+    def __init__(self, label: str, total: int):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.lock = threading.Lock()
+
+    def step(self):
+        with self.lock:
+            self.done += 1
+            print(f"{self.label} {self.done}/{self.total}")
+
+def validate_exam(exam):
+    """
+    Checks the EaC IR `exam` and returns it as `examtool.ir.Section`s, which the import accepts like the JSON IR.
+
+    Raises `ExamValidationError` with every problem found.
+    """
+    return load_exam(exam)
+
+def exam_tag(exam_id: int):
+    return f"examtool_{exam_id}"
+
+def tag_names(question: dict):
+    return [tag["name"] for tag in question.get("tags", [])]
+
+def tagged_exam_ids(question: dict):
+    """
+    IDs of the exams whose tag the question bank entry has, i.e. the exams that share it.
+    """
+    return {int(match.group(1)) for match in map(exam_tag_pattern.fullmatch, tag_names(question)) if match}
+
+def is_exam_question(question: dict, exam_id: int):
+    """
+    Whether the question bank entry was generated by examtool for exam `exam_id`.
+    """
+    tags = tag_names(question)
+    return generated_tag in tags and exam_tag(exam_id) in tags
+
+def question_content(question: dict):
+    """
+    Everything in the EaC IR question that ends up in EXAM, with the defaults filled in.
+    """
+    return {
+        "html": question["html"],
+        "points": question.get("points", 1),
+        "options": [
+            {"option": op["option"], "correctOption": op.get("correctOption", False), "defaultScore": op.get("defaultScore", 0)}
+            for op in question["options"]
+        ],
+    }
+
+def question_hash(question: dict):
+    """
+    Hash of everything in the EaC IR question that ends up in EXAM.
+    """
+    return hashlib.sha256(json.dumps(question_content(question), sort_keys=True).encode()).hexdigest()[:16]
+
+def has_content(bank_question: dict, question: dict):
+    """
+    Whether a question bank entry has exactly the content of the EaC IR `question`.
+
+    Its hash tag does not tell: the entry may have been edited in EXAM since, or an import may have died before
+    fixing its options.
+    """
+    return question_content(question_to_ir(bank_question)) == question_content(question)
+
+def hash_tag(question: dict):
+    return hash_tag_prefix + question_hash(question)
+
+def question_hash_tag(bank_question: dict):
+    """
+    Returns the hash tag of a question bank entry, or None if it was not created with one.
+    """
+    for name in tag_names(bank_question):
+        if name.startswith(hash_tag_prefix):
+            return name
+    return None
+
+def exam_questions(client, exam_id: int):
+    """
+    Returns the questions generated by examtool for exam `exam_id`, from the client's question bank cache if it has one.
+    """
+    bank = question_bank(client)
+    if bank:
+        return bank.with_tags(client, generated_tag, exam_tag(exam_id))
+    return [question for question in iter_questions(client) if is_exam_question(question, exam_id)]
+
+def generated_questions(client):
+    """
+    Returns all questions generated by examtool, from the client's question bank cache if it has one.
+    """
+    bank = question_bank(client)
+    if bank:
+        return bank.with_tags(client, generated_tag)
+    return [question for question in iter_questions(client) if generated_tag in tag_names(question)]
+
+def retag_question(client, question: dict, tags: list, owner_id: int = None):
+    """
+    Replaces the tags of a generated question bank entry, leaving the rest of it as it is.
+    """
+    owners = question.get("questionOwners") or [{"id": owner_id}]
+    return edit_question(client, question["id"], owners[0]["id"], question.get("defaultMaxScore", 1), question["question"], question["options"],
+                         [name for name in tags if name != generated_tag])
+
+def is_not_found(err: Exception):
+    """
+    Whether `err` is an error response of 404 from EXAM.
+    """
+    response = getattr(err, "response", None)
+    return response is not None and response.status_code == 404
+
+def delete_generated_question(client, question_id: int):
+    """
+    Deletes a question bank entry. A 404 means that it is gone already, e.g. deleted in EXAM after the question bank
+    was cached, so the client's question bank cache is out of date and is invalidated.
+    """
+    try:
+        delete_question(client, question_id)
+    except Exception as err:
+        if not is_not_found(err):
+            raise
+        if question_bank(client):
+            question_bank(client).invalidate()
+
+def release_question(client, question: dict, exam_ids: list, owner_id: int = None):
+    """
+    Lets go of a generated question for the exams `exam_ids`.
+
+    The question is deleted when no other exam shares it. Otherwise only the tags of `exam_ids` are dropped, so that
+    the question stays in the other exams.
+    """
+    if not tagged_exam_ids(question) - set(exam_ids):
+        delete_generated_question(client, question["id"])
+        return
+    dropped = set(map(exam_tag, exam_ids))
+    retag_question(client, question, [name for name in tag_names(question) if name not in dropped], owner_id)
+
+def reusable_questions(questions: list):
+    """
+    Indexes generated question bank entries by their hash tag, for `claim_reusable`.
+    """
+    by_hash = {}
+    for question in questions:
+        tag = question_hash_tag(question)
+        if tag:
+            by_hash.setdefault(tag, []).append(question)
+    return by_hash
+
+def claim_reusable(by_hash: dict, question: dict, exam_ids: list):
+    """
+    Takes a question bank entry with the same content as the EaC IR `question` out of `by_hash`, or returns None.
+
+    Entries that already belong to the most of `exam_ids` come first, so that as few as possible need new tags. Entries
+    whose content differs from their hash tag (see `has_content`) are never reused.
+    """
+    candidates = [entry for entry in by_hash.get(hash_tag(question), []) if has_content(entry, question)]
+    if not candidates:
+        return None
+    entry = max(candidates, key=lambda entry: len(tagged_exam_ids(entry) & set(exam_ids)))
+    by_hash[hash_tag(question)].remove(entry)
+    return entry
+
+def needs_tags(entry: dict, exam_ids: list):
+    return not set(exam_ids) <= tagged_exam_ids(entry)
+
+def reuse_question(client, entry: dict, exam_ids: list, owner_id: int, journal=None, key: tuple = ()):
+    """
+    Uses an existing question bank entry for the exams `exam_ids` instead of creating a copy of it, adding their tags
+    if it does not have them yet. Returns its ID and the IDs of its options, like `create_exam_question`.
+    """
+    if needs_tags(entry, exam_ids):
+        tags = tag_names(entry)
+        retag_question(client, entry, tags + [tag for tag in map(exam_tag, exam_ids) if tag not in tags], owner_id)
+    question_id, option_ids = entry["id"], [op["id"] for op in entry["options"]]
+    if journal:
+        journal.record("question_created", key, id=question_id, option_ids=option_ids, reused=True)
+    return question_id, option_ids
+
+def attached_questions(client, exam_id: int):
+    """
+    Returns the IDs of the questions in the sections of exam `exam_id`, an empty set if the exam does not exist, or
+    None if it could not be read.
+    """
+    try:
+        exam = get_exam(client, exam_id)
+    except Exception as err:
+        return set() if is_not_found(err) else None
+    return {sq["question"]["id"] for section in exam["examSections"] for sq in section["sectionQuestions"]}
+
+def orphaned_questions(client, jobs: int = 1):
+    """
+    Returns the questions generated by examtool that no exam they are tagged for has in its sections, e.g. because
+    an import died half way or the exam was deleted. The exams are read `jobs` at a time. Questions of exams that
+    cannot be read are kept to be safe.
+    """
+    questions = generated_questions(client)
+    exam_ids = sorted(set().union(*map(tagged_exam_ids, questions)))
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        attached = dict(zip(exam_ids, pool.map(lambda exam_id: attached_questions(client, exam_id), exam_ids)))
+    return [
+        question for question in questions
+        if all(attached[exam_id] is not None and question["id"] not in attached[exam_id] for exam_id in tagged_exam_ids(question))
+    ]
+
+def collect_garbage(client, jobs: int = 1, dry_run: bool = False):
+    """
+    Deletes the `orphaned_questions` from the question bank, at most `jobs` at a time. Returns the deleted questions.
+    """
+    questions = orphaned_questions(client, jobs)
+    if not dry_run:
+        progress = Progress("Deleting orphaned question", len(questions))
+        def delete(question):
+            progress.step()
+            delete_generated_question(client, question["id"])
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            wait_all([pool.submit(delete, question) for question in questions])
+    return questions
+
+def delete_exam_questions(client, exam_id):
+    """
+    Deletes all questions with both tags 'examtool_generated' and 'examtool_<exam_id>'
+
+    Questions that other exams share are not deleted, only their 'examtool_<exam_id>' tag is dropped.
+    """
+    for question in exam_questions(client, exam_id):
+        print(f"Deleting question {question['id']}")
+        release_question(client, question, [exam_id])
+
+def delete_sections(client, exam_id):
+    print(f"Deleting all sections from exam {exam_id}")
+    exam = get_exam(client, exam_id)
+    for section in exam["examSections"]:
+        delete_section(client, exam_id, section["id"])
+
+def wait_all(futures):
+    """
+    Waits for every future and returns their results, re-raising the first failure.
+    """
+    return [future.result() for future in futures]
+
+def needs_option_fix(question: dict):
+    """
+    Whether the options of the EaC IR question must be fixed with an edit after `create_question`.
+    """
+    return not all(is_create_safe(op['option']) for op in question["options"])
+
+def question_tags(exam_ids: list, question: dict):
+    """
+    Tags of a question generated from the EaC IR `question` for the exams `exam_ids`.
+    """
+    return [*map(exam_tag, exam_ids), hash_tag(question)]
+
+def create_exam_question(client, exam_ids: list, owner_id: int, question: dict, journal=None, key: tuple = ()):
+    """
+    Creates a question in the question bank from its EaC IR for the exams `exam_ids`. Returns its ID and the IDs of
+    its options.
+    """
+    created = create_question(client, owner_id, question.get("points", 1), question["html"], question["options"], question_tags(exam_ids, question))
+    question_id, option_ids = created['id'], [op['id'] for op in created["options"]]
+    if journal:
+        journal.record("question_created", key, id=question_id, option_ids=option_ids)
+    return question_id, option_ids
+
+def fix_question_options(client, exam_ids: list, owner_id: int, question: dict, question_id: int, option_ids: list, journal=None, key: tuple = ()):
+    """
+    Overwrites the options of a just created question, which `create_question` may have URI encoded.
+    """
+    # HACK: workaround to support URI sensitive characters in question options.
+    # We edit each question with "no change" except that we provide the option ids the previous query returned.
+    # No need to maintain the correct order of ids, we are anyways overwriting the options with new ones.
+    new_options = list([{"id": id, **opt} for id, opt in zip(option_ids, question["options"])])
+    edit_question(client, question_id, owner_id, question.get("points", 1), question["html"], new_options, question_tags(exam_ids, question))
+    if journal:
+        journal.record("question_edited", key)
+    return question_id
+
+def update_question(client, exam_id: int, owner_id: int, question_id: int, old_options: list, question: dict, progress: Progress = None):
+    """
+    Overwrites an existing question bank entry with the EaC IR `question`, keeping its ID.
+
+    `old_options` are the options of the existing question, whose IDs are reused for the new options.
+    """
+    options = question["options"]
+    new_options = [{"id": old["id"], **opt} for old, opt in zip(old_options, options)] + options[len(old_options):]
+    edit_question(client, question_id, owner_id, question.get("points", 1), question["html"], new_options, question_tags([exam_id], question))
+    if progress:
+        progress.step()
+    return question_id
+
+def create_exam_section(client, exam_id: int, journal=None, key: tuple = ()):
+    section_id = create_section(client, exam_id)['id']
+    if journal:
+        journal.record("section_created", key, id=section_id)
+    return section_id
+
+def import_section(client, exam_id: int, section: dict, section_id: int, journal=None, key: tuple = ()):
+    if journal and journal.get("section_edited", key):
+        return
+    edit_section(client, exam_id, section_id, name=section["name"], description=section["description"], lottery_on=section.get("lotteryOn", False), lottery_item_count=section.get("lotteryItemCount", None))
+    if journal:
+        journal.record("section_edited", key)
+
+def add_section_question(client, exam_id: int, section_id: int, sequence_number: int, question_id: int, journal=None, key: tuple = ()):
+    """
+    Adds a question to the section at `sequence_number`. With a `journal`, the add is recorded under `key` followed
+    by the sequence number.
+
+    EXAM inserts a question at its sequence number and shifts the ones after it, so adding the questions of a section
+    in ascending sequence number order places every question exactly at its sequence number.
+    """
+    add_question(client, exam_id, section_id, sequence_number, question_id)
+    if journal:
+        journal.record("question_added", (*key, sequence_number))
+
+def journal_leftovers(client, exam_id: int, journal, generated: list):
+    """
+    Finds what an interrupted import created without recording it in its `journal`, given all `generated` questions.
+
+    Returns the IDs of those sections, those questions, and the IDs of the questions already in each journaled section,
+    by section ID.
+    """
+    current = get_exam(client, exam_id)
+    sections = {step["id"] for step in journal.find("section_created")}
+    questions = {step["id"] for step in journal.find("question_created")}
+    orphan_sections = [section["id"] for section in current["examSections"] if section["id"] not in sections]
+    orphan_questions = [question for question in generated if is_exam_question(question, exam_id) and question["id"] not in questions]
+    attached = {
+        section["id"]: {sq["question"]["id"] for sq in section["sectionQuestions"]}
+        for section in current["examSections"] if section["id"] in sections
+    }
+    return orphan_sections, orphan_questions, attached
+
+def import_exam(client, exam_id: int, owner_id: int, exam: list, jobs: int = 1, journal=None):
+    """
+    Nukes exam `exam_id` and recreates it from the EaC IR `exam`, running at most `jobs` requests at a time.
+
+    See `examtool.planner.plan_import` for the requests this sends, and `examtool.journal` for resuming.
+    """
+    from .planner import plan_import, run_plan
+    run_plan(client, lambda: plan_import(client, [exam_id], owner_id, exam, journal), jobs)
+
+def import_exams(client, exam_ids: list, owner_id: int, exam: list, jobs: int = 1):
+    """
+    Nukes the exams `exam_ids` and recreates each of them from the EaC IR `exam`, such as the sittings of one exam.
+
+    Every question is created once and added to all of the exams, instead of once per exam. The old questions of the
+    exams are deleted only when no other exam shares them.
+    """
+    from .planner import plan_import, run_plan
+    run_plan(client, lambda: plan_import(client, exam_ids, owner_id, exam, jobs=jobs), jobs)
+
+def section_changed(existing: dict, section: dict):
+    """
+    Whether the name, description or lottery settings of an existing section differ from the EaC IR `section`.
+    """
+    lottery_on = section.get("lotteryOn", False)
+    if (existing.get("name"), existing.get("description") or "", bool(existing.get("lotteryOn"))) != (section["name"], section["description"] or "", lottery_on):
+        return True
+    return lottery_on and existing.get("lotteryItemCount") != section["lotteryItemCount"]
+
+def longest_increasing_subsequence(values: list):
+    """
+    Returns the indices of a longest strictly increasing subsequence of `values`.
+    """
+    tails = [] # tails[k] is the index of the smallest tail of an increasing subsequence of length k + 1
+    previous = [None] * len(values)
+    for i, value in enumerate(values):
+        lo, hi = 0, len(tails)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if values[tails[mid]] < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        previous[i] = tails[lo - 1] if lo > 0 else None
+        if lo == len(tails):
+            tails.append(i)
+        else:
+            tails[lo] = i
+    indices = []
+    i = tails[-1] if tails else None
+    while i is not None:
+        indices.append(i)
+        i = previous[i]
+    return indices[::-1]
+
+
+def sync_exam(client, exam_id: int, owner_id: int, exam: list, jobs: int = 1):
+    """
+    Turns exam `exam_id` into the EaC IR `exam` by sending only the requests needed to get there.
+
+    See `examtool.planner.plan_sync` for how existing questions and sections are reused.
+    """
+    from .planner import plan_sync, run_plan
+    run_plan(client, lambda: plan_sync(client, exam_id, owner_id, exam), jobs)
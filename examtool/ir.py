@@ -0,0 +1,261 @@
+"""
+Typed model of the EaC IR, and its JSON Lines format.
+
+The JSON IR is a list of sections, each with its questions. In the JSON Lines IR every section and every question is a
+record of its own, `{"type": "section", ...}` or `{"type": "question", ...}`, and the questions that follow a section
+belong to it. The last record, `{"type": "end", "sections": N, "questions": M}`, counts them, so that an input cut
+short, e.g. by a producer that failed halfway, is rejected instead of imported in part. It can be written and read one
+record at a time, e.g. through a pipe from `typst_exam --jsonl`.
+"""
+import itertools, json
+from collections.abc import Mapping
+
+class ExamValidationError(ValueError):
+    """
+    Raised for EaC IR that cannot be imported, with every problem found in `errors`.
+    """
+    def __init__(self, errors: list):
+        super().__init__("\n".join(errors))
+        self.errors = errors
+
+class Record(Mapping):
+    """
+    Base of the IR classes. Their attributes are slots, and they read like the dicts of the JSON IR by the IR keys in
+    `ir_keys`, so that code written for the dicts works with both. Attributes that are None are left out.
+    """
+    __slots__ = ()
+    ir_keys = {}
+
+    def __getitem__(self, key: str):
+        value = getattr(self, self.ir_keys[key]) if key in self.ir_keys else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        return (key for key, attribute in self.ir_keys.items() if getattr(self, attribute) is not None)
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def to_dict(self):
+        """
+        The JSON IR of the record.
+        """
+        return {key: [item.to_dict() for item in value] if isinstance(value, list) else value for key, value in self.items()}
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+class Option(Record):
+    __slots__ = ("option", "correct_option", "default_score")
+    ir_keys = {"option": "option", "correctOption": "correct_option", "defaultScore": "default_score"}
+
+    def __init__(self, option: str, correct_option: bool = False, default_score: float = None):
+        self.option = option
+        self.correct_option = correct_option
+        self.default_score = default_score
+
+    @classmethod
+    def from_ir(cls, data, errors: list, where: str):
+        """
+        Converts an option of the JSON IR, adding its problems to `errors`. Returns None if it is unusable.
+        """
+        if not isinstance(data, dict) or not isinstance(data.get("option"), str):
+            errors.append(f"{where}: the text of an option must be a string in `option`")
+            return None
+        if data.get("defaultScore") is not None and not is_number(data["defaultScore"]):
+            errors.append(f"{where}: defaultScore must be a number")
+        return cls(data["option"], bool(data.get("correctOption", False)), data.get("defaultScore"))
+
+class Question(Record):
+    __slots__ = ("html", "points", "options")
+    ir_keys = {"html": "html", "points": "points", "options": "options"}
+
+    def __init__(self, html: str, options: list, points: float = None):
+        self.html = html
+        self.options = options
+        self.points = points
+
+    @classmethod
+    def from_ir(cls, data, errors: list, where: str):
+        """
+        Converts and checks a question of the JSON IR, adding its problems to `errors`. Returns None if it is unusable.
+        """
+        if not isinstance(data, dict):
+            errors.append(f"{where}: a question must be an object")
+            return None
+        if not isinstance(data.get("html"), str):
+            errors.append(f"{where}: html must be a string")
+        if data.get("points") is not None and not is_number(data["points"]):
+            errors.append(f"{where}: points must be a number")
+        options = data.get("options")
+        if not isinstance(options, list):
+            errors.append(f"{where}: options must be a list")
+            options = []
+        options = [Option.from_ir(option, errors, f"{where} option {k + 1}") for k, option in enumerate(options)]
+        if len(options) < 2:
+            errors.append(f"{where}: number of options < 2")
+        elif not any(option and option.correct_option for option in options):
+            errors.append(f"{where}: missing correct option")
+        return cls(data.get("html"), [option for option in options if option], data.get("points"))
+
+class Section(Record):
+    __slots__ = ("name", "description", "questions", "lottery_on", "lottery_item_count")
+    ir_keys = {"name": "name", "description": "description", "lotteryOn": "lottery_on", "lotteryItemCount": "lottery_item_count", "questions": "questions"}
+
+    def __init__(self, name: str, description: str = "", questions: list = None, lottery_on: bool = None, lottery_item_count: int = None):
+        self.name = name
+        self.description = description
+        self.questions = [] if questions is None else questions
+        self.lottery_on = lottery_on
+        self.lottery_item_count = lottery_item_count
+
+    @classmethod
+    def from_ir(cls, data, errors: list, where: str, questions: bool = True):
+        """
+        Converts and checks a section of the JSON IR, adding its problems to `errors`. Returns None if it is unusable.
+
+        Its questions are converted too, unless `questions` is false. Call `check` once all of its questions are in.
+        """
+        if not isinstance(data, dict):
+            errors.append(f"{where}: a section must be an object")
+            return None
+        if not isinstance(data.get("name"), str):
+            errors.append(f"{where}: name must be a string")
+        if not isinstance(data.get("description", ""), str):
+            errors.append(f"{where}: description must be a string")
+        if ("lotteryOn" in data) != ("lotteryItemCount" in data):
+            errors.append(f"{where}: lotteryOn and lotteryItemCount must be given together")
+        elif "lotteryItemCount" in data:
+            if data["lotteryOn"] is not True:
+                errors.append(f"{where}: lotteryItemCount requires lotteryOn to be true")
+            if not isinstance(data["lotteryItemCount"], int) or data["lotteryItemCount"] < 1:
+                errors.append(f"{where}: lotteryItemCount must be a positive integer")
+        section = cls(data.get("name"), data.get("description", ""), None, data.get("lotteryOn"), data.get("lotteryItemCount"))
+        if questions:
+            if not isinstance(data.get("questions"), list):
+                errors.append(f"{where}: questions must be a list")
+            for j, question in enumerate(data.get("questions") or []):
+                section.questions.append(Question.from_ir(question, errors, f"{where} question {j + 1}"))
+            section.questions = [question for question in section.questions if question]
+        return section
+
+    def check(self, errors: list, where: str):
+        """
+        Adds the problems of the section that depend on its questions to `errors`.
+        """
+        if is_number(self.lottery_item_count) and self.lottery_item_count > len(self.questions):
+            errors.append(f"{where}: lotteryItemCount > number of questions ({len(self.questions)})")
+
+def load_exam(exam: list):
+    """
+    Converts the JSON IR into `Section`s, checking all of it in one pass.
+
+    Raises `ExamValidationError` with every problem found.
+    """
+    errors = []
+    if not isinstance(exam, list):
+        raise ExamValidationError(["the exam must be a list of sections"])
+    sections = []
+    for i, data in enumerate(exam):
+        section = Section.from_ir(data, errors, f"section {i + 1}")
+        if section:
+            section.check(errors, f"section {i + 1}")
+            sections.append(section)
+    if errors:
+        raise ExamValidationError(errors)
+    return sections
+
+def read_jsonl_exam(lines):
+    """
+    Reads the JSON Lines IR one record at a time from an iterable of lines, such as a file, into `Section`s.
+
+    Raises `ExamValidationError` with every problem found, by line number, also when the input is empty or does not
+    end with an end record that matches it.
+    """
+    errors, sections = [], []
+    section, where, end = None, None, None
+    last, questions = None, 0
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        last = line_number
+        if end:
+            errors.append(f"line {line_number}: record after the end record")
+            break
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as err:
+            errors.append(f"line {line_number}: {err}")
+            continue
+        kind = record.get("type") if isinstance(record, dict) else None
+        if kind == "section":
+            if section:
+                section.check(errors, where)
+            where = f"line {line_number}: section {len(sections) + 1}"
+            # An unusable section still collects its questions, so that their problems are reported too
+            section = Section.from_ir(record, errors, where, questions=False) or Section(None)
+            sections.append(section)
+        elif kind == "question":
+            questions += 1
+            if section is None:
+                errors.append(f"line {line_number}: question outside of a section")
+                continue
+            question = Question.from_ir(record, errors, f"line {line_number}: section {len(sections)} question {len(section.questions) + 1}")
+            if question:
+                section.questions.append(question)
+        elif kind == "end":
+            end = record
+            if (record.get("sections"), record.get("questions")) != (len(sections), questions):
+                errors.append(f"line {line_number}: the end record counts {record.get('sections')} sections and {record.get('questions')} questions, but {len(sections)} and {questions} were read")
+        else:
+            errors.append(f"line {line_number}: records must have a type of \"section\", \"question\" or \"end\"")
+    if section:
+        section.check(errors, where)
+    if last is None:
+        errors.append("the input is empty")
+    elif not end:
+        errors.append(f"line {last}: the input ends without an end record, it may have been cut short")
+    if errors:
+        raise ExamValidationError(errors)
+    return sections
+
+def end_record(sections: int, questions: int):
+    """
+    The last record of the JSON Lines IR, counting the section and question records before it.
+    """
+    return {"type": "end", "sections": sections, "questions": questions}
+
+def jsonl_records(exam: list):
+    """
+    Yields the records of the JSON Lines IR of `exam`, in either the JSON IR or `Section`s, ending with the end record.
+    """
+    questions = 0
+    for section in exam:
+        yield {"type": "section", **{key: value for key, value in section.items() if key != "questions"}}
+        for question in section["questions"]:
+            yield {"type": "question", **(question.to_dict() if isinstance(question, Record) else question)}
+        questions += len(section["questions"])
+    yield end_record(len(exam), questions)
+
+def write_jsonl_exam(exam: list, file):
+    for record in jsonl_records(exam):
+        file.write(json.dumps(record) + "\n")
+
+def read_exam(file):
+    """
+    Reads the EaC IR in either format from a text file into `Section`s, telling them apart by the first character.
+    """
+    head = []
+    for line in file:
+        head.append(line)
+        if line.strip():
+            break
+    lines = itertools.chain(head, file)
+    if "".join(head).lstrip().startswith("["):
+        return load_exam(json.loads("".join(lines)))
+    return read_jsonl_exam(lines)
@@ -0,0 +1,97 @@
+import hashlib, json, os, threading
+from .paths import server_cache_path
+
+def default_journal_path(exam_id: int):
+    return server_cache_path("journal", f"-{exam_id}.jsonl")
+
+def exam_digest(exam: list):
+    # The IR may be `examtool.ir` records, which convert with dict
+    return hashlib.sha256(json.dumps(exam, sort_keys=True, default=dict).encode()).hexdigest()
+
+class JournalError(Exception):
+    pass
+
+class Journal:
+    """
+    Append-only log of the completed steps of an import, one JSON object per line.
+
+    Each step is recorded as `{"op": ..., "key": [...], ...}` right after EXAM has confirmed it, together with the IDs
+    the server returned. The first line describes the import, so that a journal is never resumed for another exam or
+    another version of the IR.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.steps = {}
+        self.file = None
+
+    @classmethod
+    def start(cls, path: str, exam_id: int, exam: list):
+        """
+        Starts a new journal at `path`, replacing any previous one.
+        """
+        journal = cls(path)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        journal.file = open(path, "w")
+        journal.write({"op": "start", "exam_id": exam_id, "exam": exam_digest(exam)})
+        return journal
+
+    @classmethod
+    def resume(cls, path: str, exam_id: int, exam: list):
+        """
+        Opens the journal at `path` for continuing the import of `exam` into exam `exam_id`.
+        """
+        if not os.path.exists(path):
+            raise JournalError(f"no journal to resume at {path}")
+        journal = cls(path)
+        with open(path) as f:
+            lines = f.read().splitlines()
+        header = json.loads(lines[0]) if lines else {}
+        if header.get("exam_id") != exam_id or header.get("exam") != exam_digest(exam):
+            raise JournalError(f"journal {path} is for another exam or another version of the JSON file")
+        for line in lines[1:]:
+            try:
+                step = json.loads(line)
+            except json.JSONDecodeError:
+                break # the last line may be cut short when the import died
+            journal.steps[(step["op"], tuple(step["key"]))] = step
+        journal.file = open(path, "a")
+        return journal
+
+    def write(self, data: dict):
+        with self.lock:
+            self.file.write(json.dumps(data) + "\n")
+            self.file.flush()
+
+    def record(self, op: str, key: tuple = (), **fields):
+        step = {"op": op, "key": list(key), **fields}
+        self.write(step)
+        with self.lock:
+            self.steps[(op, tuple(key))] = step
+
+    def get(self, op: str, key: tuple = ()):
+        """
+        Returns the recorded step, or None if it has not been completed.
+        """
+        with self.lock:
+            return self.steps.get((op, tuple(key)))
+
+    def find(self, op: str):
+        """
+        Returns all recorded steps of kind `op`.
+        """
+        with self.lock:
+            return [step for (kind, key), step in self.steps.items() if kind == op]
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def remove(self):
+        """
+        Deletes the journal of a finished import.
+        """
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
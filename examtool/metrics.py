@@ -0,0 +1,121 @@
+import json, math, os, re, sys, threading, time
+from urllib.parse import urlsplit
+from .paths import server_cache_path
+
+def endpoint_name(method: str, url: str):
+    """
+    Names the endpoint of a request, e.g. `PUT /app/exams/{id}/sections/{id}`.
+    """
+    return f"{method} {re.sub(r'/[0-9]+(?=/|$)', '/{id}', urlsplit(url).path)}"
+
+def percentile(values: list, p: float):
+    """
+    Nearest-rank percentile of the sorted `values`.
+    """
+    return values[max(0, math.ceil(p * len(values)) - 1)]
+
+def default_latencies_path():
+    """
+    Latencies measured against `sdk.base_url`, which `import --dry-run` uses for its estimates.
+    """
+    return server_cache_path("latencies", ".json")
+
+def load_latencies(path: str):
+    """
+    Returns the p50 latency in seconds of each endpoint in a file of `save_latencies` or of `Recorder.dump`.
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        summary = json.load(f)["summary"]
+    return {endpoint: stats["p50"] for endpoint, stats in summary.items()}
+
+def save_latencies(path: str, summary: dict):
+    """
+    Stores the p50 latencies of a `Recorder.summary`, keeping the ones of the endpoints it does not have.
+    """
+    latencies = load_latencies(path)
+    latencies.update((endpoint, stats["p50"]) for endpoint, stats in summary.items())
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"summary": {endpoint: {"p50": seconds} for endpoint, seconds in latencies.items()}}, f, indent=1)
+    os.replace(tmp, path)
+
+class Recorder:
+    """
+    Records the endpoint, status, size and latency of every request sent through the sessions it is installed on.
+
+    It hooks into the `requests` response hooks, so every SDK call is recorded, and so is every retry of
+    `examtool.transport.ExamSession`. The latency includes downloading the response body, except for streamed
+    responses, whose body is left for the caller: their latency is the time to the headers and their size is taken
+    from `Content-Length`.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = []
+        self.started = time.time()
+
+    def install(self, session):
+        session.hooks["response"].append(self.hook)
+        return session
+
+    def hook(self, response, *args, stream: bool = False, **kwargs):
+        start = time.perf_counter()
+        size = int(response.headers.get("Content-Length") or 0) if stream else len(response.content)
+        seconds = response.elapsed.total_seconds() + time.perf_counter() - start
+        record = {
+            "endpoint": endpoint_name(response.request.method, response.request.url),
+            "status": response.status_code,
+            "bytes": size,
+            "seconds": seconds,
+            # When the request was sent, relative to the creation of the recorder
+            "start": time.time() - seconds - self.started,
+        }
+        with self.lock:
+            self.records.append(record)
+        return response
+
+    def summary(self):
+        """
+        Returns the count, total bytes, errors, and p50, p95 and max latency in seconds of each endpoint.
+        """
+        with self.lock:
+            records = list(self.records)
+        endpoints = {}
+        for record in records:
+            endpoints.setdefault(record["endpoint"], []).append(record)
+        summary = {}
+        for endpoint, records in sorted(endpoints.items()):
+            latencies = sorted(record["seconds"] for record in records)
+            summary[endpoint] = {
+                "count": len(records),
+                "errors": sum(1 for record in records if record["status"] >= 400),
+                "bytes": sum(record["bytes"] for record in records),
+                "p50": percentile(latencies, 0.5),
+                "p95": percentile(latencies, 0.95),
+                "max": latencies[-1],
+            }
+        return summary
+
+    def report(self, file=sys.stderr):
+        """
+        Prints the summary as a table.
+        """
+        summary = self.summary()
+        width = max([len("endpoint")] + [len(endpoint) for endpoint in summary])
+        print(f"{'endpoint':<{width}} {'count':>6} {'errors':>6} {'bytes':>10} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}", file=file)
+        for endpoint, stats in summary.items():
+            print(f"{endpoint:<{width}} {stats['count']:>6} {stats['errors']:>6} {stats['bytes']:>10} "
+                  f"{stats['p50'] * 1000:>8.1f} {stats['p95'] * 1000:>8.1f} {stats['max'] * 1000:>8.1f}", file=file)
+        total = sum(stats["count"] for stats in summary.values())
+        print(f"{total} requests in {time.time() - self.started:.2f} s", file=file)
+
+    def dump(self, path: str):
+        """
+        Writes every request and the summary into a JSON trace file.
+        """
+        with self.lock:
+            records = list(self.records)
+        with open(path, "w") as f:
+            json.dump({"requests": records, "summary": self.summary()}, f, indent=1)
@@ -0,0 +1,172 @@
+import hashlib, json, os, sqlite3, time
+from concurrent.futures import ThreadPoolExecutor
+from .paths import server_cache_path
+from .exporter import fetch_exams, exam_to_ir
+from .sdk import iter_exams, iter_questions
+
+schema = """
+CREATE TABLE IF NOT EXISTS exams (id INTEGER PRIMARY KEY, name TEXT, digest TEXT NOT NULL, data TEXT NOT NULL, synced REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS sections (id INTEGER PRIMARY KEY, exam_id INTEGER NOT NULL, sequence_number INTEGER NOT NULL,
+    name TEXT, description TEXT, lottery_on INTEGER NOT NULL, lottery_item_count INTEGER);
+CREATE INDEX IF NOT EXISTS sections_exam ON sections (exam_id);
+CREATE TABLE IF NOT EXISTS section_questions (section_id INTEGER NOT NULL, sequence_number INTEGER NOT NULL, question_id INTEGER NOT NULL,
+    PRIMARY KEY (section_id, sequence_number));
+CREATE INDEX IF NOT EXISTS section_questions_question ON section_questions (question_id);
+CREATE TABLE IF NOT EXISTS questions (id INTEGER PRIMARY KEY, html TEXT, points REAL, digest TEXT NOT NULL, data TEXT NOT NULL, synced REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS question_tags (question_id INTEGER NOT NULL, tag TEXT NOT NULL, PRIMARY KEY (question_id, tag));
+CREATE INDEX IF NOT EXISTS question_tags_tag ON question_tags (tag);
+"""
+
+def default_mirror_path():
+    """
+    Mirror database of `sdk.base_url`.
+    """
+    return server_cache_path("mirror", ".sqlite3")
+
+def digest(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+class Mirror:
+    """
+    Local SQLite copy of exams, their sections and the question bank, for reporting and search without EXAM.
+
+    Every row stores a digest of the JSON it was made from, so that a refresh only writes the exams and questions
+    that changed and deletes the ones that are gone. Not thread-safe: fetch concurrently, but update from one thread.
+    """
+    def __init__(self, path: str = None):
+        self.path = path or default_mirror_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.db = sqlite3.connect(self.path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.db:
+            self.db.close()
+            self.db = None
+
+    def put_question(self, question: dict, synced: float):
+        """
+        Adds or replaces a question bank entry. Returns whether it changed.
+        """
+        new_digest = digest(question)
+        row = self.db.execute("SELECT digest FROM questions WHERE id = ?", (question["id"],)).fetchone()
+        if row and row[0] == new_digest:
+            return False
+        self.db.execute("INSERT OR REPLACE INTO questions VALUES (?, ?, ?, ?, ?, ?)", (
+            question["id"], question.get("question"), question.get("defaultMaxScore"), new_digest, json.dumps(question), synced))
+        self.db.execute("DELETE FROM question_tags WHERE question_id = ?", (question["id"],))
+        self.db.executemany("INSERT OR IGNORE INTO question_tags VALUES (?, ?)", [(question["id"], tag["name"]) for tag in question.get("tags", [])])
+        return True
+
+    def put_exam(self, exam: dict, synced: float, questions: bool = True):
+        """
+        Adds or replaces an exam of `get_exam` with its sections, and its questions unless `questions` is false.
+
+        Returns whether it changed.
+        """
+        new_digest = digest(exam)
+        row = self.db.execute("SELECT digest FROM exams WHERE id = ?", (exam["id"],)).fetchone()
+        if row and row[0] == new_digest:
+            return False
+        self.delete_exam(exam["id"])
+        self.db.execute("INSERT INTO exams VALUES (?, ?, ?, ?, ?)", (exam["id"], exam.get("name"), new_digest, json.dumps(exam), synced))
+        for section in exam.get("examSections", []):
+            self.db.execute("INSERT INTO sections VALUES (?, ?, ?, ?, ?, ?, ?)", (
+                section["id"], exam["id"], section["sequenceNumber"], section.get("name"), section.get("description"),
+                bool(section.get("lotteryOn")), section.get("lotteryItemCount")))
+            for sq in section.get("sectionQuestions", []):
+                self.db.execute("INSERT INTO section_questions VALUES (?, ?, ?)", (section["id"], sq["sequenceNumber"], sq["question"]["id"]))
+                if questions:
+                    self.put_question(sq["question"], synced)
+        return True
+
+    def delete_exam(self, exam_id: int):
+        self.db.execute("DELETE FROM section_questions WHERE section_id IN (SELECT id FROM sections WHERE exam_id = ?)", (exam_id,))
+        self.db.execute("DELETE FROM sections WHERE exam_id = ?", (exam_id,))
+        self.db.execute("DELETE FROM exams WHERE id = ?", (exam_id,))
+
+    def delete_questions_except(self, question_ids: set):
+        """
+        Deletes the questions that are not in `question_ids`. Returns how many were deleted.
+        """
+        gone = [id for (id,) in self.db.execute("SELECT id FROM questions") if id not in question_ids]
+        self.db.executemany("DELETE FROM question_tags WHERE question_id = ?", [(id,) for id in gone])
+        self.db.executemany("DELETE FROM questions WHERE id = ?", [(id,) for id in gone])
+        return len(gone)
+
+    def update(self, exams: list = (), questions: list = None):
+        """
+        Stores the given exams of `get_exam`, and the whole question bank if `questions` is given.
+
+        `questions` may be an iterator such as `iter_questions`, which is consumed before `exams`, one question at a time.
+        Returns the number of exams and questions that changed, and of questions that were deleted.
+        """
+        synced = time.time()
+        stats = {"exams": 0, "questions": 0, "deleted": 0}
+        with self.db:
+            if questions is not None:
+                ids = set()
+                for question in questions:
+                    stats["questions"] += self.put_question(question, synced)
+                    ids.add(question["id"])
+                stats["deleted"] = self.delete_questions_except(ids)
+            for exam in exams:
+                # The question bank is authoritative when given
+                stats["exams"] += self.put_exam(exam, synced, questions is None)
+        return stats
+
+    def refresh(self, client, exam_ids: list = None, jobs: int = 1):
+        """
+        Downloads the exams `exam_ids`, or all exams of the user, and the question bank, and updates the mirror.
+
+        The exams are fetched at most `jobs` requests at a time while the question bank is streamed into the mirror one
+        question at a time, so that the bank is never held in memory as a whole.
+        """
+        if exam_ids is None:
+            exam_ids = [exam["id"] for exam in iter_exams(client, ["id"])]
+            with self.db:
+                for (id,) in self.db.execute("SELECT id FROM exams").fetchall():
+                    if id not in exam_ids:
+                        self.delete_exam(id)
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            fetched = pool.submit(fetch_exams, client, exam_ids, jobs)
+            def exams():
+                # Waited for only once the question bank has been stored
+                yield from fetched.result()
+            return self.update(exams(), iter_questions(client))
+
+    def exam_ids(self):
+        return [id for (id,) in self.db.execute("SELECT id FROM exams ORDER BY id")]
+
+    def exam_ir(self, exam_id: int):
+        """
+        Returns the EaC IR of a mirrored exam, or None if it is not in the mirror.
+        """
+        row = self.db.execute("SELECT data FROM exams WHERE id = ?", (exam_id,)).fetchone()
+        return exam_to_ir(json.loads(row[0])) if row else None
+
+    def search(self, text: str = "", tags: list = ()):
+        """
+        Returns the mirrored questions whose HTML contains `text`, case-insensitively, and that have every one of `tags`.
+        """
+        query = "SELECT data FROM questions WHERE instr(lower(html), lower(?)) > 0"
+        params = [text]
+        for tag in tags:
+            query += " AND id IN (SELECT question_id FROM question_tags WHERE tag = ?)"
+            params.append(tag)
+        return [json.loads(data) for (data,) in self.db.execute(query + " ORDER BY id", params)]
+
+    def question_exams(self, question_id: int):
+        """
+        Returns the IDs of the mirrored exams that use the question.
+        """
+        return [id for (id,) in self.db.execute(
+            "SELECT DISTINCT sections.exam_id FROM section_questions JOIN sections ON sections.id = section_questions.section_id "
+            "WHERE section_questions.question_id = ? ORDER BY sections.exam_id", (question_id,))]
@@ -0,0 +1,17 @@
+import hashlib, os
+
+def cache_dir():
+    """
+    Directory for the local caches of examtool, `$XDG_CACHE_HOME/examtool`.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "examtool")
+
+def server_cache_path(name: str, suffix: str):
+    """
+    File `name-<key><suffix>` in `cache_dir`, where the key tells apart the servers of `sdk.base_url`.
+    """
+    # Imported here so that e.g. typst_exam can use `cache_dir` without the SDK
+    from . import sdk
+    key = hashlib.sha256(sdk.base_url.encode()).hexdigest()[:12]
+    return os.path.join(cache_dir(), f"{name}-{key}{suffix}")
@@ -0,0 +1,382 @@
+"""
+Import and sync plans: the list of requests that turns an exam into its EaC IR, with the dependencies between them.
+
+A plan is built from the IR and the current state of the server without changing anything, so it can be printed
+and costed with `--dry-run`. `execute_plan` then sends the requests, each as soon as the ones it depends on are done.
+"""
+import heapq, sys
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from .importer import *
+from .exporter import fetch_exams
+
+# Assumed latency of endpoints that have not been measured yet, in seconds
+default_latency = 0.1
+
+class Operation:
+    """
+    One step of a plan, usually a single request to `endpoint` (named like in `examtool.metrics`).
+
+    `run(results)` performs it, where `results` holds the results of the steps it depends on by key. Steps without an
+    endpoint send no request and only wait for their dependencies.
+    """
+    def __init__(self, key: tuple, endpoint: str, kind: str, target: str, run, depends: list, progress: Progress = None):
+        self.key = key
+        self.endpoint = endpoint
+        self.kind = kind
+        self.target = target
+        self.run = run
+        self.depends = depends
+        self.progress = progress
+
+class Plan:
+    """
+    Operations in an order where every operation comes after the ones it depends on.
+
+    `results` holds the results of steps that are already done, e.g. IDs of existing questions or of steps recorded
+    in a journal. Dependencies on them are dropped.
+    """
+    def __init__(self):
+        self.operations = []
+        self.by_key = {}
+        self.results = {}
+
+    def add(self, key: tuple, endpoint: str, kind: str, target: str, run, depends: list = ()):
+        depends = [dep for dep in depends if dep in self.by_key]
+        operation = Operation(key, endpoint, kind, target, run, depends)
+        self.operations.append(operation)
+        self.by_key[key] = operation
+        return key
+
+    def requests(self):
+        return sum(1 for op in self.operations if op.endpoint)
+
+    def counts(self):
+        """
+        Number of operations of each kind, in plan order.
+        """
+        return Counter(op.kind for op in self.operations if op.kind != "wait for")
+
+    def summary(self):
+        counts = ", ".join(f"{n} to {kind}" for kind, n in self.counts().items()) or "nothing to do"
+        return f"Plan: {counts} ({self.requests()} requests)"
+
+    def estimate(self, latencies: dict, jobs: int = 1, rate: float = None):
+        """
+        Estimated seconds to execute the plan with at most `jobs` concurrent requests and `rate` requests per second.
+
+        Simulates the execution with the latency of each endpoint taken from `latencies`.
+        """
+        known = list(latencies.values())
+        fallback = sorted(known)[len(known) // 2] if known else default_latency
+        finish = {}
+        workers = [0.0] * max(1, jobs)
+        for op in self.operations:
+            ready = max((finish[dep] for dep in op.depends), default=0.0)
+            if not op.endpoint:
+                finish[op.key] = ready
+                continue
+            start = max(ready, heapq.heappop(workers))
+            finish[op.key] = start + latencies.get(op.endpoint, fallback)
+            heapq.heappush(workers, finish[op.key])
+        seconds = max(finish.values(), default=0.0)
+        if rate:
+            seconds = max(seconds, self.requests() / rate)
+        return seconds
+
+    def print(self, latencies: dict = {}, jobs: int = 1, rate: float = None, file=sys.stdout):
+        """
+        Prints every operation with the numbers of the operations it waits for, and the summary and estimate.
+        """
+        numbers = {op.key: n for n, op in enumerate(self.operations, 1)}
+        for n, op in enumerate(self.operations, 1):
+            after = f"  after {', '.join(str(numbers[dep]) for dep in op.depends)}" if op.depends else ""
+            print(f"{n:>6} {op.endpoint or '-':<46} {op.kind} {op.target}{after}", file=file)
+        print(self.summary(), file=file)
+        measured = sum(1 for op in self.operations if op.endpoint in latencies)
+        print(f"Estimated {self.estimate(latencies, jobs, rate):.1f} s with {jobs} concurrent requests"
+              f" ({measured}/{self.requests()} requests with measured latencies)", file=file)
+
+def execute_plan(plan: Plan, jobs: int = 1):
+    """
+    Executes the plan, running at most `jobs` operations at a time, and returns the results of the operations by key.
+
+    Every operation is started as soon as the ones it depends on are done. The first failure cancels the rest.
+    """
+    results = dict(plan.results)
+    for kind, total in plan.counts().items():
+        progress = Progress(kind[0].upper() + kind[1:], total)
+        for op in plan.operations:
+            if op.kind == kind and op.endpoint:
+                op.progress = progress
+    missing = {op.key: len(op.depends) for op in plan.operations}
+    dependents = {}
+    for op in plan.operations:
+        for dep in op.depends:
+            dependents.setdefault(dep, []).append(op)
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        running = {}
+        try:
+            for op in plan.operations:
+                if not op.depends:
+                    running[pool.submit(op.run, results)] = op
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    op = running.pop(future)
+                    results[op.key] = future.result()
+                    if op.progress:
+                        op.progress.step()
+                    for dependent in dependents.get(op.key, []):
+                        missing[dependent.key] -= 1
+                        if missing[dependent.key] == 0:
+                            running[pool.submit(dependent.run, results)] = dependent
+        except BaseException:
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+    return results
+
+def run_plan(client, make_plan, jobs: int = 1):
+    """
+    Prints and executes the plan made by `make_plan()`, running at most `jobs` operations at a time.
+
+    A 404 while executing it means that the plan was made from a client's question bank cache that is out of date,
+    e.g. with a question deleted in EXAM since. The cache is then invalidated, and a new plan is made and executed
+    once from the question bank downloaded again and from what the first one already did.
+    """
+    plan = make_plan()
+    print(plan.summary())
+    try:
+        return execute_plan(plan, jobs)
+    except Exception as err:
+        if not (question_bank(client) and is_not_found(err)):
+            raise
+        print(f"The cached question bank is out of date ({err}), planning again")
+        question_bank(client).invalidate()
+    plan = make_plan()
+    print(plan.summary())
+    return execute_plan(plan, jobs)
+
+def add_release_operations(plan: Plan, client, questions: list, exam_ids: list, owner_id: int):
+    """
+    Adds the release (see `release_question`) of the generated `questions` for the exams `exam_ids`.
+    """
+    keys = []
+    for question in questions:
+        id, shared = question["id"], tagged_exam_ids(question) - set(exam_ids)
+        if shared:
+            keys.append(plan.add(("release", id), "PUT /app/questions/{id}", "untag question", f"{id} (kept for exams {', '.join(map(str, sorted(shared)))})",
+                                 lambda results, question=question: release_question(client, question, exam_ids, owner_id)))
+        else:
+            keys.append(plan.add(("release", id), "DELETE /app/questions/{id}", "delete question", str(id),
+                                 lambda results, question=question: release_question(client, question, exam_ids, owner_id)))
+    return keys
+
+def add_question_operations(plan: Plan, client, exam_ids: list, owner_id: int, exam: list, todo: list, depends: list = (), journal=None, reused: dict = {}):
+    """
+    Adds the creation of the IR questions at `todo` positions `(i, j)` for the exams `exam_ids` as `("question", i, j)`.
+
+    Questions whose options `create_question` would mangle are fixed with an edit, `("fix", i, j)`. The positions in
+    `reused` get the question bank entry there instead of a new question (see `reuse_question`).
+    """
+    for i, j in todo:
+        question, key = exam[i]["questions"][j], (i, j)
+        step = journal.get("question_created", key) if journal else None
+        if step:
+            plan.results[("question", i, j)] = (step["id"], step["option_ids"])
+        elif key in reused:
+            entry = reused[key]
+            plan.add(("question", i, j), "PUT /app/questions/{id}" if needs_tags(entry, exam_ids) else None, "reuse question", f"{i + 1}.{j + 1} ({entry['id']})",
+                     lambda results, entry=entry, key=key: reuse_question(client, entry, exam_ids, owner_id, journal, key), depends)
+            continue
+        else:
+            plan.add(("question", i, j), "POST /app/questions", "create question", f"{i + 1}.{j + 1}",
+                     lambda results, question=question, key=key: create_exam_question(client, exam_ids, owner_id, question, journal, key), depends)
+        if needs_option_fix(question) and not (step and step.get("reused")) and not (journal and journal.get("question_edited", key)):
+            plan.add(("fix", i, j), "PUT /app/questions/{id}", "fix options of question", f"{i + 1}.{j + 1}",
+                     lambda results, question=question, key=key: fix_question_options(client, exam_ids, owner_id, question, *results[("question", *key)], journal, key),
+                     [("question", i, j)])
+
+def add_section_operations(plan: Plan, client, exam_id: int, section: dict, i: int, depends: list, edit: bool = True, journal=None):
+    """
+    Adds the creation of section `i` of exam `exam_id` as `("section", exam_id, i)` after `depends`, and its edit
+    unless `edit` is false.
+    """
+    step = journal.get("section_created", (i,)) if journal else None
+    if step:
+        plan.results[("section", exam_id, i)] = step["id"]
+    elif ("section", exam_id, i) not in plan.results:
+        plan.add(("section", exam_id, i), "POST /app/exams/{id}/sections", "create section", f"{i + 1} of exam {exam_id}",
+                 lambda results: create_exam_section(client, exam_id, journal, (i,)), depends)
+    if edit and not (journal and journal.get("section_edited", (i,))):
+        plan.add(("edit_section", exam_id, i), "PUT /app/exams/{id}/sections/{id}", "edit section", f"{i + 1} of exam {exam_id}",
+                 lambda results: import_section(client, exam_id, section, results[("section", exam_id, i)], journal, (i,)), [("section", exam_id, i)])
+
+def add_add_operations(plan: Plan, client, exam_id: int, i: int, positions: list, depends: list = (), journal=None):
+    """
+    Adds the adds of the questions at `positions` of section `i` of exam `exam_id`, one after another in ascending order.
+    """
+    previous = None
+    for j in positions:
+        plan.add(("add", exam_id, i, j), "POST /app/exams/{id}/sections/{id}/questions", "add question", f"{i + 1}.{j + 1} to exam {exam_id}",
+                 lambda results, j=j: add_section_question(client, exam_id, results[("section", exam_id, i)], j, results[("question", i, j)][0], journal, (i,)),
+                 [("section", exam_id, i), ("question", i, j), ("fix", i, j), ("edit", i, j), previous, *depends])
+        previous = ("add", exam_id, i, j)
+
+def plan_import(client, exam_ids: list, owner_id: int, exam: list, journal=None, jobs: int = 1):
+    """
+    Plans nuking the exams `exam_ids` and recreating each of them from the EaC IR `exam`.
+
+    Every question is created in the question bank once, independently of the sections, and may fix its options right
+    after, unless the bank already has an identical one to reuse (see `claim_reusable`). It is then added to the sections of every exam. Sections are created one after another, since EXAM orders
+    them by creation, and the questions of each section are added in IR order as soon as they exist. The old questions
+    of the exams are deleted, except those that other exams share, which are only untagged. Planning reads the exams
+    `jobs` at a time.
+
+    With a `journal` (see `examtool.journal`), every completed step of the import into a single exam is recorded. When
+    the journal is from an interrupted import, the plan continues from where it stopped: it deletes only what the
+    import left behind without recording it, and skips the recorded steps.
+    """
+    assert journal is None or len(exam_ids) == 1, "a journal is for importing into one exam"
+    plan = Plan()
+    attached = {}
+    generated = generated_questions(client)
+    if journal and journal.get("nuked"):
+        section_ids, questions, attached = journal_leftovers(client, exam_ids[0], journal, generated)
+        sections = {exam_ids[0]: section_ids}
+    else:
+        questions = [question for question in generated if tagged_exam_ids(question) & set(exam_ids)]
+        sections = {exam_id: [section["id"] for section in exam["examSections"]] for exam_id, exam in zip(exam_ids, fetch_exams(client, exam_ids, jobs))}
+
+    # Questions already in the bank are reused instead of creating copies of them
+    todo = [(i, j) for i, section in enumerate(exam) for j in range(len(section["questions"]))]
+    journaled = {step["id"] for step in journal.find("question_created")} if journal else set()
+    by_hash = reusable_questions([question for question in generated if question["id"] not in journaled])
+    reused = {}
+    for i, j in todo:
+        if not (journal and journal.get("question_created", (i, j))):
+            entry = claim_reusable(by_hash, exam[i]["questions"][j], exam_ids)
+            if entry:
+                reused[(i, j)] = entry
+    reused_ids = {entry["id"] for entry in reused.values()}
+    questions = [question for question in questions if question["id"] not in reused_ids]
+
+    deletes = add_release_operations(plan, client, questions, exam_ids, owner_id)
+    section_deletes = {
+        exam_id: [plan.add(("delete_section", id), "DELETE /app/exams/{id}/sections/{id}", "delete section", f"{id} of exam {exam_id}",
+                           lambda results, exam_id=exam_id, id=id: delete_section(client, exam_id, id)) for id in ids]
+        for exam_id, ids in sections.items()
+    }
+    nuked = []
+    if journal and not journal.get("nuked"):
+        # The journal must not record anything new before the old exam is gone
+        nuked = [plan.add(("nuked",), None, "wait for", "the deletes", lambda results: journal.record("nuked"), deletes + section_deletes[exam_ids[0]])]
+
+    add_question_operations(plan, client, exam_ids, owner_id, exam, todo, nuked, journal, reused)
+    for exam_id in exam_ids:
+        previous = section_deletes.get(exam_id, []) + nuked
+        for i, section in enumerate(exam):
+            add_section_operations(plan, client, exam_id, section, i, previous, journal=journal)
+            previous = [("section", exam_id, i)]
+            # Questions are added in order, so the ones already in the section are the first ones
+            done = len(attached.get(plan.results.get(("section", exam_id, i)), ()))
+            add_add_operations(plan, client, exam_id, i, range(done, len(section["questions"])), journal=journal)
+    return plan
+
+def plan_sync(client, exam_id: int, owner_id: int, exam: list):
+    """
+    Plans turning exam `exam_id` into the EaC IR `exam` with only the requests needed to get there.
+
+    Questions generated by examtool are matched to the IR by their hash tag and content, wherever they are in the
+    exam, so that questions edited in EXAM or left with mangled options are not taken as up to date. Changed
+    questions are edited in place when an unmatched generated question sits at the same position, so question IDs stay
+    stable across re-imports. New questions reuse identical question bank entries of other exams. Sections are matched
+    by position. Everything else is created, removed or deleted.
+    """
+    current = get_exam(client, exam_id)
+    bank = generated_questions(client)
+    generated = {question["id"]: question for question in bank if is_exam_question(question, exam_id)}
+    existing_sections = sorted(current["examSections"], key=lambda section: section["sequenceNumber"])
+    existing_questions = [
+        [sq["question"]["id"] for sq in sorted(section["sectionQuestions"], key=lambda sq: sq["sequenceNumber"])]
+        for section in existing_sections
+    ]
+
+    # Candidates for reuse by hash tag, attached questions first in exam order
+    by_hash = {}
+    attached = [id for ids in existing_questions for id in ids if id in generated]
+    for id in attached + [id for id in generated if id not in set(attached)]:
+        tag = question_hash_tag(generated[id])
+        if tag:
+            by_hash.setdefault(tag, []).append(id)
+
+    claimed = set()
+    target_ids = [[None] * len(section["questions"]) for section in exam]
+    for i, section in enumerate(exam):
+        for j, question in enumerate(section["questions"]):
+            candidates = by_hash.get(hash_tag(question), [])
+            match = next((id for id in candidates if has_content(generated[id], question)), None)
+            if match is not None:
+                candidates.remove(match)
+                target_ids[i][j] = match
+                claimed.add(match)
+
+    edits, creates = [], []
+    for i, section in enumerate(exam):
+        for j, question in enumerate(section["questions"]):
+            if target_ids[i][j] is not None:
+                continue
+            old = existing_questions[i][j] if i < len(existing_questions) and j < len(existing_questions[i]) else None
+            # Shared questions are not edited, as the other exams would change too
+            if old in generated and old not in claimed and not tagged_exam_ids(generated[old]) - {exam_id}:
+                claimed.add(old)
+                target_ids[i][j] = old
+                edits.append((i, j))
+            else:
+                creates.append((i, j))
+
+    # New questions may already be in the bank for other exams
+    others = reusable_questions([question for question in bank if question["id"] not in generated])
+    reused = {key: entry for key, entry in ((key, claim_reusable(others, exam[key[0]]["questions"][key[1]], [exam_id])) for key in creates) if entry}
+
+    deletes = [id for id in generated if id not in claimed]
+    deleted = {id for id in deletes if not tagged_exam_ids(generated[id]) - {exam_id}}
+    deleted_sections = [section["id"] for section in existing_sections[len(exam):]]
+
+    # Questions that stay where they are: the longest run of each section that is already in target order
+    removes, staying = [], []
+    for i, ids in enumerate(existing_questions[:len(exam)]):
+        target = {id: j for j, id in enumerate(target_ids[i]) if id is not None}
+        kept = [id for id in ids if id in target]
+        keep = {kept[k] for k in longest_increasing_subsequence([target[id] for id in kept])}
+        staying.append(keep)
+        removes += [(existing_sections[i]["id"], id) for id in ids if id not in keep and id not in deleted]
+    staying += [set()] * (len(exam) - len(staying))
+
+    plan = Plan()
+    cleanup = add_release_operations(plan, client, [generated[id] for id in deletes], [exam_id], owner_id)
+    cleanup += [plan.add(("remove", section_id, id), "DELETE /app/exams/{id}/sections/{id}/questions/{id}", "remove question", f"{id} from section {section_id}",
+                         lambda results, section_id=section_id, id=id: remove_question(client, exam_id, section_id, id)) for section_id, id in removes]
+    section_deletes = [plan.add(("delete_section", id), "DELETE /app/exams/{id}/sections/{id}", "delete section", f"{id} of exam {exam_id}", lambda results, id=id: delete_section(client, exam_id, id)) for id in deleted_sections]
+    # Adds insert at sequence numbers, so they must wait for the questions that go away
+    cleaned = [plan.add(("cleaned",), None, "wait for", "the deletes and removes", lambda results: None, cleanup)] if cleanup else []
+
+    for i, ids in enumerate(target_ids):
+        for j, id in enumerate(ids):
+            if id is not None:
+                plan.results[("question", i, j)] = (id, None)
+    add_question_operations(plan, client, [exam_id], owner_id, exam, creates, reused=reused)
+    for i, j in edits:
+        id = target_ids[i][j]
+        plan.add(("edit", i, j), "PUT /app/questions/{id}", "edit question", f"{i + 1}.{j + 1} ({id})",
+                 lambda results, id=id, question=exam[i]["questions"][j]: update_question(client, exam_id, owner_id, id, generated[id].get("options", []), question))
+
+    previous = section_deletes
+    for i, section in enumerate(exam):
+        if i < len(existing_sections):
+            plan.results[("section", exam_id, i)] = existing_sections[i]["id"]
+        add_section_operations(plan, client, exam_id, section, i, previous, edit=i >= len(existing_sections) or section_changed(existing_sections[i], section))
+        previous = [("section", exam_id, i)]
+        add_add_operations(plan, client, exam_id, i, [j for j, id in enumerate(target_ids[i]) if id is None or id not in staying[i]], cleaned)
+    return plan
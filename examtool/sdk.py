@@ -1,10 +1,14 @@
-import requests, os
+import codecs, json, os
+from urllib.parse import quote
 headers = {
     'Accept': 'application/json',
 }
 
 generated_tag = "examtool_generated"
 
+# Point this (or the EXAM_URL environment variable) to e.g. `examtool.fake_server` to work offline
+base_url = os.environ.get("EXAM_URL", "https://exam.aalto.fi")
+
 def is_login(response):
     return "Aalto University Login" in response.text
 
@@ -15,6 +19,7 @@ def raise_for_status_with_body(response):
     """
     Checks the response and raises an HTTPError with the response body if the response is not OK.
     """
+    import requests
     try:
         response.raise_for_status()
     except requests.HTTPError as err:
@@ -25,6 +30,7 @@ def raise_for_status_with_body(response):
         ) from None
 
 def handle_error_response(resp):
+    import requests
     if is_login(resp):
         raise requests.HTTPError("response was login page (make sure cookies are fresh)", response=resp)
     if is_csrf_error(resp):
@@ -33,12 +39,89 @@ def handle_error_response(resp):
     return resp
 
 
+def streamed_response(resp):
+    """
+    Like `handle_error_response`, but leaves the body of a successful JSON response unread, so that it can be streamed.
+    """
+    if resp.ok and "json" in resp.headers.get("Content-Type", ""):
+        return resp
+    return handle_error_response(resp)
+
+def iter_json_array(chunks, fields: list = None):
+    """
+    Decodes a JSON array from an iterable of UTF-8 encoded chunks, yielding its elements one at a time.
+
+    Only the element being decoded and the rest of the current chunk are held in memory, so that peak memory scales
+    with the largest element instead of the whole array. With `fields`, only those keys of each element are kept.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer, pos = "", 0
+    state = "start" # then "first" right after "[", "value" after a "," and "separator" after a value
+
+    def more():
+        nonlocal buffer, pos
+        for chunk in chunks:
+            decoded = text.decode(chunk)
+            if decoded:
+                buffer, pos = buffer[pos:] + decoded, 0
+                return True
+        return False
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n":
+            pos += 1
+        if pos == len(buffer):
+            if not more():
+                raise json.JSONDecodeError("Unterminated array", buffer, pos)
+            continue
+        char = buffer[pos]
+        if state == "start":
+            if char != "[":
+                raise json.JSONDecodeError("Expecting '['", buffer, pos)
+            pos, state = pos + 1, "first"
+        elif char == "]" and state in ("first", "separator"):
+            return
+        elif state == "separator":
+            if char != ",":
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+            pos, state = pos + 1, "value"
+        else:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Most likely the value continues in the next chunk
+                if more():
+                    continue
+                raise
+            if not isinstance(value, (dict, list, str)) and buffer[end:].lstrip()[:1] not in (",", "]") and more():
+                # A number may continue in the next chunk, e.g. "1." and "5"
+                continue
+            pos, state = end, "separator"
+            yield {key: value[key] for key in fields if key in value} if fields else value
+
+def iter_json(client, url: str, fields: list = None, chunk_size: int = 64 * 1024):
+    """
+    GETs a JSON array from EXAM and yields its elements as they arrive, see `iter_json_array`.
+
+    The request is sent when the first element is asked for.
+    """
+    with client.get(url, headers=headers, stream=True) as resp:
+        yield from iter_json_array(streamed_response(resp).iter_content(chunk_size), fields)
+
 def get_exams(client):
-    resp = client.get(f'https://exam.aalto.fi/app/reviewerexams', headers=headers)
+    resp = client.get(f'{base_url}/app/reviewerexams', headers=headers)
     return handle_error_response(resp).json()
 
+def iter_exams(client, fields: list = None):
+    """
+    Like `get_exams`, but yields the exams one at a time while they are downloaded, keeping only `fields` of each if given.
+    """
+    return iter_json(client, f'{base_url}/app/reviewerexams', fields)
+
 def get_exam(client, exam_id: int):
-    resp = client.get(f'https://exam.aalto.fi/app/exams/{str(exam_id)}', headers=headers)
+    resp = client.get(f'{base_url}/app/exams/{str(exam_id)}', headers=headers)
     return handle_error_response(resp).json()
 
 # A successful request, returns at least `.id: int` and `.sequence_number: int`
@@ -48,7 +131,7 @@ def create_section(client, exam_id: int):
     
     Does not support name, description etc. Use `edit_section` to provide them.
     """
-    resp = client.post(f'https://exam.aalto.fi/app/exams/{str(exam_id)}/sections', headers=headers)
+    resp = client.post(f'{base_url}/app/exams/{str(exam_id)}/sections', headers=headers)
     return handle_error_response(resp).json()
 
 def edit_section(client, exam_id: int, section_id: int, name: str, description: str, lottery_on: bool = False, lottery_item_count: int = None):
@@ -57,7 +140,7 @@ def edit_section(client, exam_id: int, section_id: int, name: str, description:
     
     Notice that the EXAM API returns `lotteryItemCount: 1` even when given a 0 as the count is 0 by default, but all validations ensure it's > 0. It also seems to support saving a higher number than there are questions in the section.
     """
-    resp = client.put(f'https://exam.aalto.fi/app/exams/{str(exam_id)}/sections/{str(section_id)}', headers=headers, json={
+    resp = client.put(f'{base_url}/app/exams/{str(exam_id)}/sections/{str(section_id)}', headers=headers, json={
         "name": name,
         "description": description,
         "lotteryOn": lottery_on,
@@ -68,31 +151,56 @@ def edit_section(client, exam_id: int, section_id: int, name: str, description:
     return handle_error_response(resp).json()
 
 def delete_section(client, exam_id: int, section_id: int):
-    resp = client.delete(f'https://exam.aalto.fi/app/exams/{str(exam_id)}/sections/{str(section_id)}', headers=headers)
+    resp = client.delete(f'{base_url}/app/exams/{str(exam_id)}/sections/{str(section_id)}', headers=headers)
     handle_error_response(resp)
 
 # TODO handle response body: sitnet_question_already_in_section
 def add_question(client, exam_id: int, section_id: int, sequence_number: int, question_id: int):
-    resp = client.post(f'https://exam.aalto.fi/app/exams/{str(exam_id)}/sections/{str(section_id)}/questions', headers=headers, json={
+    resp = client.post(f'{base_url}/app/exams/{str(exam_id)}/sections/{str(section_id)}/questions', headers=headers, json={
         "sequenceNumber": sequence_number,
         "questions": str(question_id)
     })
     return handle_error_response(resp).json()
 
 def remove_question(client, exam_id: int, section_id: int, question_id: int):
-    resp = client.delete(f'https://exam.aalto.fi/app/exams/{str(exam_id)}/sections/{str(section_id)}/questions/{str(question_id)}', headers=headers)
+    resp = client.delete(f'{base_url}/app/exams/{str(exam_id)}/sections/{str(section_id)}/questions/{str(question_id)}', headers=headers)
     handle_error_response(resp)
 
+def question_bank(client):
+    """
+    Returns the `examtool.cache.QuestionBank` attached to the client as `client.question_bank`, if any.
+
+    The question bank calls below keep an attached cache up to date.
+    """
+    return getattr(client, "question_bank", None)
+
 # Deletes the question from the "question bank"
 def delete_question(client, question_id: int):
-    resp = client.delete(f'https://exam.aalto.fi/app/questions/{str(question_id)}', headers=headers)
+    resp = client.delete(f'{base_url}/app/questions/{str(question_id)}', headers=headers)
     handle_error_response(resp)
+    if question_bank(client):
+        question_bank(client).discard(question_id)
 
 # Gets all questions from the "question bank"
 def get_questions(client):
-    resp = client.get(f'https://exam.aalto.fi/app/questions', headers=headers)
+    resp = client.get(f'{base_url}/app/questions', headers=headers)
     return handle_error_response(resp).json()
 
+def iter_questions(client, fields: list = None):
+    """
+    Like `get_questions`, but yields the questions one at a time while they are downloaded, keeping only `fields` of
+    each if given, e.g. `["id", "tags"]`. Memory use then scales with one question instead of the whole bank.
+    """
+    return iter_json(client, f'{base_url}/app/questions', fields)
+
+def is_create_safe(option: str):
+    """
+    Whether `create_question` gets the option text through unchanged.
+
+    We don't know exactly which characters the platform encodes, so anything that would be URI encoded is unsafe.
+    """
+    return quote(option, safe=" ") == option
+
 def mk_question_data(owner_id: int, default_max_score: int, question: str, options: list, tags=[]):
     template_option = {
                 "correctOption": False,
@@ -124,8 +232,11 @@ def edit_question(client, question_id: int, owner_id: int, default_max_score: in
 
     Each option should contain the ID of the option that is being replaced.
     """
-    resp = client.put(f'https://exam.aalto.fi/app/questions/{str(question_id)}', headers=headers, json=mk_question_data(owner_id, default_max_score, question, options, tags))
-    return handle_error_response(resp).json()
+    resp = client.put(f'{base_url}/app/questions/{str(question_id)}', headers=headers, json=mk_question_data(owner_id, default_max_score, question, options, tags))
+    result = handle_error_response(resp).json()
+    if question_bank(client):
+        question_bank(client).put(result)
+    return result
 
 # TODO add a tag to all questions created with examtool for automated deletion. with this the tool doesn't need to store state
 def create_question(client, owner_id: int, default_max_score: int, question: str, options: list, tags=[]):
@@ -138,9 +249,13 @@ def create_question(client, owner_id: int, default_max_score: int, question: str
     - For "single correct" set `correctOption` to True on exactly one of the options and leave `defaultScore` unset.
     - For "many correct" set `defaultScore` appropriately for each question and leave `correctOption` unset.
     
-    `option` should not contain URI sensitive characters, as the platform encodes them. Use `edit_question` to fix.
+    `option` should not contain URI sensitive characters, as the platform encodes them. Use `edit_question` to fix
+    the options for which `is_create_safe` is false.
 
     Use `tags` to define extra tags, such as exam id or section id. They are useful if you want to delete all questions in an exam.
     """
-    resp = client.post(f'https://exam.aalto.fi/app/questions', headers=headers, json=mk_question_data(owner_id, default_max_score, question, options, tags))
-    return handle_error_response(resp).json()
+    resp = client.post(f'{base_url}/app/questions', headers=headers, json=mk_question_data(owner_id, default_max_score, question, options, tags))
+    result = handle_error_response(resp).json()
+    if question_bank(client):
+        question_bank(client).put(result)
+    return result
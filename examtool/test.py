@@ -0,0 +1,559 @@
+import contextlib, copy, io, json, os, subprocess, sys
+import pytest
+from requests import Session
+from examtool import *
+from examtool import cli, sdk
+from examtool.cache import QuestionBank
+from examtool.exporter import export_exams
+from examtool.fake_server import FakeExamServer, synthetic_exam
+from examtool.ir import ExamValidationError, read_exam, write_jsonl_exam
+from examtool.journal import Journal, JournalError
+from examtool.metrics import Recorder
+from examtool.mirror import Mirror
+from examtool.paths import server_cache_path
+from examtool.planner import execute_plan, plan_import, plan_sync
+from examtool.transport import ExamSession
+
+@contextlib.contextmanager
+def serving(**kwargs):
+    with FakeExamServer(**kwargs) as server:
+        old_url = sdk.base_url
+        sdk.base_url = server.url
+        try:
+            yield server
+        finally:
+            sdk.base_url = old_url
+
+@pytest.fixture
+def server():
+    with serving() as server:
+        yield server
+
+def layout(client, exam_id):
+    """
+    The parts of an exam that examtool is responsible for.
+    """
+    return [
+        (section["name"], section["description"], [
+            (sq["question"]["question"], [op["option"] for op in sq["question"]["options"]])
+            for sq in sorted(section["sectionQuestions"], key=lambda sq: sq["sequenceNumber"])
+        ])
+        for section in sorted(get_exam(client, exam_id)["examSections"], key=lambda section: section["sequenceNumber"])
+    ]
+
+def quiet(f, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return f(*args, **kwargs)
+
+def test_import_concurrent_matches_sequential(server):
+    client = Session()
+    exam = synthetic_exam(25, questions_per_section=7)
+    exam[0]["questions"][0]["options"][1]["option"] = "a & b = c?"
+    sequential, concurrent = server.exam.add_exam(), server.exam.add_exam()
+    quiet(import_exam, client, sequential, 1, exam, jobs=1)
+    quiet(import_exam, client, concurrent, 1, exam, jobs=8)
+    quiet(import_exam, client, concurrent, 1, exam, jobs=8)
+    assert layout(client, sequential) == layout(client, concurrent)
+    assert layout(client, sequential)[0][2][0] == ("<p>Question 1</p>", ["Option 1", "a & b = c?", "Option 3", "Option 4"])
+
+def test_import_request_count(server):
+    exam_id = server.exam.add_exam()
+    quiet(import_exam, Session(), exam_id, 1, synthetic_exam(10), jobs=4)
+    # get questions, get exam, 1 section * (create + edit), 10 questions * (create + add)
+    assert server.requests == 2 + 2 + 10 * 2
+
+    exam = synthetic_exam(10)
+    exam[0]["questions"][0]["options"][0]["option"] = "50%"
+    before = server.requests
+    quiet(import_exam, Session(), exam_id, 1, exam, jobs=4)
+    # The 9 unchanged questions are reused: 1 section and 1 question to delete, 1 question to create and fix
+    assert server.requests - before == 2 + 1 + 1 + 2 + 2 + 10
+    assert layout(Session(), exam_id)[0][2][0][1][0] == "50%"
+
+def test_sync_sends_only_changes(server):
+    client = Session()
+    exam = synthetic_exam(20)
+    exam_id = server.exam.add_exam()
+    quiet(import_exam, client, exam_id, 1, exam, jobs=4)
+    ids = {sq["question"]["id"] for section in get_exam(client, exam_id)["examSections"] for sq in section["sectionQuestions"]}
+
+    before = server.requests
+    quiet(sync_exam, client, exam_id, 1, exam, jobs=4)
+    assert server.requests - before == 2
+
+    changed = copy.deepcopy(exam)
+    changed[0]["questions"][3]["options"][0]["option"] = "Typo fixed"
+    changed[1]["questions"].reverse()
+    changed[1]["name"] = "Renamed"
+    before = server.requests
+    quiet(sync_exam, client, exam_id, 1, changed, jobs=4)
+    # 1 edit in place, 1 section edit and the reversed section moves all but one question
+    assert server.requests - before == 2 + 1 + 1 + 2 * 9
+    assert layout(client, exam_id)[1][0] == "Renamed"
+    assert ids == {sq["question"]["id"] for section in get_exam(client, exam_id)["examSections"] for sq in section["sectionQuestions"]}
+
+    fresh = server.exam.add_exam()
+    quiet(import_exam, client, fresh, 1, changed, jobs=4)
+    assert layout(client, exam_id) == layout(client, fresh)
+
+def test_sync_checks_question_content(server):
+    client = Session()
+    exam = synthetic_exam(5)
+    exam[0]["questions"][0]["options"][0]["option"] = "50%"
+    exam_id = server.exam.add_exam()
+    quiet(import_exam, client, exam_id, 1, exam, jobs=4)
+
+    # As if an import had died before fixing the options of the first question, and the next two were edited in EXAM
+    first, second, third = (sq["question"]["id"] for sq in get_exam(client, exam_id)["examSections"][0]["sectionQuestions"][:3])
+    server.exam.questions[first]["options"][0]["option"] = "50%25"
+    server.exam.questions[second]["question"] = "<p>Edited in EXAM</p>"
+    server.exam.questions[third]["defaultMaxScore"] = 5
+    plan = plan_sync(client, exam_id, 1, exam)
+    assert plan.counts() == {"edit question": 3}
+    quiet(execute_plan, plan, jobs=4)
+    fresh = server.exam.add_exam()
+    quiet(import_exam, client, fresh, 1, exam, jobs=4)
+    assert layout(client, exam_id) == layout(client, fresh)
+    assert layout(client, exam_id)[0][2][0][1][0] == "50%"
+    assert plan_sync(client, exam_id, 1, exam).requests() == 0
+
+def test_question_bank_cache(server, tmp_path):
+    client = Session()
+    client.question_bank = QuestionBank(str(tmp_path / "questions.json"), ttl=600)
+    exam = synthetic_exam(10)
+    exam_id = server.exam.add_exam()
+    quiet(import_exam, client, exam_id, 1, exam, jobs=4)
+    quiet(sync_exam, client, exam_id, 1, exam[:1] + [{**exam[0], "name": "Copy"}], jobs=4)
+    assert server.counts["GET /app/questions"] == 1
+
+    client.question_bank.save()
+    bank = QuestionBank(str(tmp_path / "questions.json"), ttl=600)
+    assert len(bank.with_tags(client, generated_tag, exam_tag(exam_id))) == 20
+    assert {question["id"] for question in bank.with_tags(client)} == set(server.exam.questions)
+
+    # Questions that examtool did not generate are neither kept nor saved
+    manual = create_question(client, 1, 1, "<p>Manual</p>", [{"option": "a", "correctOption": True}, {"option": "b"}])
+    server.exam.questions[manual["id"]]["tags"] = []
+    bank.invalidate()
+    assert len(bank.with_tags(client, exam_tag(exam_id))) == 20
+    assert server.counts["GET /app/questions"] == 2
+    assert manual["id"] not in bank.questions and len(bank.questions) == len(server.exam.questions) - 1
+    bank.save()
+    with open(tmp_path / "questions.json") as f:
+        assert manual["id"] not in {question["id"] for question in json.load(f)["questions"]}
+
+def test_server_cache_paths(monkeypatch):
+    from examtool import cache, journal, metrics, mirror
+    paths = [cache.default_cache_path(), journal.default_journal_path(7), metrics.default_latencies_path(), mirror.default_mirror_path()]
+    assert [os.path.basename(path).split("-")[0] for path in paths] == ["questions", "journal", "latencies", "mirror"]
+    assert len({os.path.basename(path).split("-")[1].split(".")[0] for path in paths}) == 1
+    monkeypatch.setattr(sdk, "base_url", "http://localhost:8000")
+    assert server_cache_path("questions", ".json") == cache.default_cache_path() != paths[0]
+
+def test_stale_question_bank_cache(server, tmp_path):
+    client = Session()
+    client.question_bank = QuestionBank(str(tmp_path / "questions.json"), ttl=600)
+    exam = synthetic_exam(10)
+    exam_id = server.exam.add_exam()
+    quiet(import_exam, client, exam_id, 1, exam, jobs=4)
+    expected = layout(client, exam_id)
+    ids = [sq["question"]["id"] for sq in get_exam(client, exam_id)["examSections"][0]["sectionQuestions"]]
+
+    # Deleted in EXAM after the question bank was cached: adding the cached question fails, and the import is planned again
+    delete_question(Session(), ids[0])
+    quiet(import_exam, client, exam_id, 1, exam, jobs=4)
+    assert server.counts["GET /app/questions"] == 2
+    assert layout(client, exam_id) == expected
+
+    # A question to delete that is gone already needs no deleting
+    changed = copy.deepcopy(exam)
+    changed[0]["questions"][1]["html"] = "<p>Changed</p>"
+    client.question_bank.refresh(client)
+    delete_question(Session(), ids[1])
+    quiet(import_exam, client, exam_id, 1, changed, jobs=4)
+    assert server.counts[r"DELETE /app/questions/(\d+)"] == 3
+    assert not client.question_bank.is_fresh()
+    assert layout(client, exam_id)[0][2][1][0] == "<p>Changed</p>"
+    assert len(layout(client, exam_id)[0][2]) == 10
+
+def test_transport_retries_injected_errors():
+    with serving(error_rate=0.3, seed=1) as server:
+        client = ExamSession(pool_size=8, retries=10, backoff=0.001)
+        exam_id = server.exam.add_exam()
+        quiet(import_exam, client, exam_id, 1, synthetic_exam(10), jobs=8)
+        assert server.requests > 2 + 2 + 10 * 2
+        assert layout(client, exam_id) == [("Section 1", "", [(f"<p>Question {i}</p>", ["Option 1", "Option 2", "Option 3", "Option 4"]) for i in range(1, 11)])]
+
+def test_post_retries():
+    import requests
+    from examtool.transport import is_retryable, is_retryable_error
+    def response(status):
+        response = requests.Response()
+        response.status_code, response._content = status, b""
+        return response
+    # A POST that may have been processed, e.g. behind a gateway that timed out, could create things twice
+    assert [status for status in (429, 500, 502, 503, 504) if is_retryable("POST", response(status))] == [429, 503]
+    assert all(is_retryable("PUT", response(status)) for status in (429, 500, 502, 503, 504))
+    with pytest.raises(requests.ConnectionError) as refused:
+        Session().post("http://127.0.0.1:1/app/questions")
+    assert is_retryable_error("POST", refused.value)
+    assert not is_retryable_error("POST", requests.ConnectionError("connection reset")) and is_retryable_error("PUT", requests.ConnectionError())
+
+    # The async client retries the same connect failures
+    pytest.importorskip("aiohttp")
+    import asyncio
+    from examtool import aio
+    async def refused():
+        async with aio.AsyncExamSession(retries=0) as client:
+            await client.post("http://127.0.0.1:1/app/questions")
+    with pytest.raises(requests.ConnectionError) as refused_async:
+        asyncio.run(refused())
+    assert is_retryable_error("POST", refused_async.value)
+
+def test_resume_interrupted_import(server, tmp_path, monkeypatch):
+    import examtool.importer
+    client = Session()
+    exam = synthetic_exam(30, questions_per_section=7)
+    exam[1]["questions"][2]["options"][0]["option"] = "1 + 1"
+    reference = server.exam.add_exam()
+    quiet(import_exam, client, reference, 1, exam, jobs=4)
+
+    class Interrupted(Exception):
+        pass
+
+    calls = 0
+    def flaky_add_question(*args):
+        nonlocal calls
+        calls += 1
+        if calls == 12:
+            raise Interrupted()
+        return add_question(*args)
+
+    exam_id = server.exam.add_exam()
+    journal = Journal.start(str(tmp_path / "journal.jsonl"), exam_id, exam)
+    with monkeypatch.context() as m:
+        m.setattr(examtool.importer, "add_question", flaky_add_question)
+        with pytest.raises(Interrupted):
+            quiet(import_exam, client, exam_id, 1, exam, jobs=4, journal=journal)
+    journal.close()
+
+    # Something the journal does not know about, as if the import died right after the request
+    create_section(client, exam_id)
+
+    before = server.requests
+    journal = Journal.resume(str(tmp_path / "journal.jsonl"), exam_id, exam)
+    quiet(import_exam, client, exam_id, 1, exam, jobs=4, journal=journal)
+    assert layout(client, exam_id) == layout(client, reference)
+    # Both exams use the same questions
+    assert len(get_questions(client)) == 30
+    # Resuming costs only the remaining adds and the clean up, not a full import
+    assert server.requests - before < 30
+
+    with pytest.raises(JournalError):
+        Journal.resume(str(tmp_path / "journal.jsonl"), exam_id, exam[1:])
+
+def test_profile_recorder(server, tmp_path):
+    client = Session()
+    recorder = Recorder()
+    recorder.install(client)
+    exam_id = server.exam.add_exam()
+    quiet(import_exam, client, exam_id, 1, synthetic_exam(10), jobs=4)
+    summary = recorder.summary()
+    assert summary["POST /app/questions"]["count"] == 10
+    assert summary["POST /app/exams/{id}/sections/{id}/questions"]["count"] == 10
+    assert sum(stats["count"] for stats in summary.values()) == server.requests
+    assert all(0 < stats["p50"] <= stats["p95"] <= stats["max"] for stats in summary.values())
+
+    recorder.dump(str(tmp_path / "trace.json"))
+    with open(tmp_path / "trace.json") as f:
+        assert len(json.load(f)["requests"]) == server.requests
+
+def test_cli_lazy_imports():
+    # `requests` is loaded only by the commands that talk to EXAM
+    code = "import sys; from examtool import cli; cli.make_parser().format_help(); print(sorted({'requests', 'markdown'} & set(sys.modules)))"
+    assert subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout == "[]\n"
+    assert {verb for verb, subject in cli.commands} == set(cli.verbs)
+    # Looking up a name of the package imports only the modules searched for it
+    code = "import sys, examtool; examtool.init_client; print(sorted(name for name in sys.modules if name.startswith(('examtool.', 'requests'))))"
+    assert subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout == "['examtool.cli']\n"
+
+def test_package_names():
+    import examtool, examtool.importer
+    assert examtool.import_exam is examtool.importer.import_exam and examtool.init_client is cli.init_client
+    assert examtool.mirror.Mirror is Mirror
+    assert {"import_exam", "get_questions", "init_client"} <= set(examtool.__all__)
+    assert "ExamSession" not in examtool.__all__ and "ThreadPoolExecutor" not in examtool.__all__
+    with pytest.raises(AttributeError):
+        examtool.no_such_name
+
+def test_export_round_trip(server):
+    client = Session()
+    exam = synthetic_exam(12, questions_per_section=5)
+    exam[1].update(lotteryOn=True, lotteryItemCount=2)
+    exam[2]["questions"][0]["points"] = 3
+    exam_id = server.exam.add_exam()
+    quiet(import_exam, client, exam_id, 1, exam, jobs=4)
+
+    exported = export_exams(client, [exam_id], jobs=4)[exam_id]
+    validate_exam(exported)
+    hashes = lambda exam: [(section["name"], section.get("lotteryItemCount"), [question_hash(q) for q in section["questions"]]) for section in exam]
+    assert hashes(exported) == hashes(exam)
+
+def test_mirror_refresh(server, tmp_path):
+    client = Session()
+    exam_id = server.exam.add_exam()
+    quiet(import_exam, client, exam_id, 1, synthetic_exam(10), jobs=4)
+    with Mirror(str(tmp_path / "mirror.sqlite3")) as mirror:
+        assert mirror.refresh(client, jobs=4) == {"exams": 1, "questions": 10, "deleted": 0}
+        assert mirror.refresh(client, jobs=4) == {"exams": 0, "questions": 0, "deleted": 0}
+
+        question = get_questions(client)[0]
+        edit_question(client, question["id"], 1, 1, "<p>Edited</p>", question["options"], [exam_tag(exam_id)])
+        delete_question(client, get_questions(client)[1]["id"])
+        assert mirror.refresh(client, jobs=4) == {"exams": 1, "questions": 1, "deleted": 1}
+
+        assert [q["id"] for q in mirror.search("edited", [exam_tag(exam_id)])] == [question["id"]]
+        assert len(mirror.search("question", [generated_tag])) == 8
+        assert mirror.question_exams(question["id"]) == [exam_id]
+        assert mirror.exam_ir(exam_id) == export_exams(client, [exam_id])[exam_id]
+
+        # The whole bank is mirrored, also the questions that examtool did not generate
+        manual = create_question(client, 1, 1, "<p>Manual</p>", [{"option": "a", "correctOption": True}, {"option": "b"}])
+        server.exam.questions[manual["id"]]["tags"] = []
+        assert mirror.refresh(client, jobs=4) == {"exams": 0, "questions": 1, "deleted": 0}
+        assert [q["id"] for q in mirror.search("manual")] == [manual["id"]]
+
+def test_plan_dry_run(server):
+    client = Session()
+    exam = synthetic_exam(10)
+    exam[0]["questions"][0]["options"][0]["option"] = "50%"
+    exam_id = server.exam.add_exam()
+    plan = plan_import(client, [exam_id], 1, exam)
+    # Planning only reads: get questions, get exam
+    assert server.requests == 2
+    assert plan.counts() == {"create question": 10, "fix options of question": 1, "create section": 1, "edit section": 1, "add question": 10}
+
+    latencies = {op.endpoint: 1.0 for op in plan.operations}
+    assert plan.estimate(latencies, jobs=1) == plan.requests()
+    # Create and fix the first question, then add the 10 questions one after another
+    assert plan.estimate(latencies, jobs=100) == 12
+    assert plan.estimate(latencies, jobs=100, rate=1) == plan.requests()
+
+    quiet(execute_plan, plan, jobs=4)
+    assert server.requests == 2 + plan.requests()
+    assert layout(client, exam_id)[0][2][0][1][0] == "50%"
+    assert plan_sync(client, exam_id, 1, exam).requests() == 0
+
+def test_fan_out_import(server):
+    client = Session()
+    exam = synthetic_exam(10, questions_per_section=5)
+    a, b, c = (server.exam.add_exam() for _ in range(3))
+    quiet(import_exams, client, [a, b, c], 1, exam, jobs=4)
+    # get questions, 3 * get exam, 10 questions once, 3 * 2 sections * (create + edit), 3 * 10 adds
+    assert server.requests == 1 + 3 + 10 + 3 * 2 * 2 + 3 * 10
+    assert layout(client, a) == layout(client, b) == layout(client, c)
+    assert len(get_questions(client)) == 10
+
+    # Re-importing one sitting keeps the questions that the others still use
+    changed = copy.deepcopy(exam)
+    changed[0]["questions"][0]["html"] = "<p>Changed</p>"
+    quiet(import_exam, client, a, 1, changed, jobs=4)
+    assert layout(client, a)[0][2][0][0] == "<p>Changed</p>"
+    assert layout(client, b) == layout(client, c) != layout(client, a)
+    assert len(get_questions(client)) == 11
+    # Syncing reuses the changed question of the other exam
+    quiet(sync_exam, client, b, 1, changed, jobs=4)
+    assert layout(client, b) == layout(client, a)
+    assert len(get_questions(client)) == 11
+
+    # Once no exam uses it, a question is only tagged for the exams that do
+    quiet(import_exams, client, [b, c], 1, exam, jobs=4)
+    assert len(get_questions(client)) == 11
+    assert sorted(sorted(tagged_exam_ids(question)) for question in get_questions(client)) == [[a]] + [[a, b, c]] * 9 + [[b, c]]
+
+def test_dedup_and_gc(server):
+    client = Session()
+    exam = synthetic_exam(10)
+    exam_id = server.exam.add_exam()
+    quiet(import_exam, client, exam_id, 1, exam, jobs=4)
+    ids = sorted(question["id"] for question in get_questions(client))
+
+    # Re-importing the same IR only rebuilds the sections
+    before = server.requests
+    quiet(import_exam, client, exam_id, 1, exam, jobs=4)
+    assert server.requests - before == 2 + 1 + 2 + 10
+    assert sorted(question["id"] for question in get_questions(client)) == ids
+
+    # Questions of deleted exams and questions left out of their exam are orphans
+    lost = create_question(client, 1, 1, "<p>Lost</p>", exam[0]["questions"][0]["options"], [exam_tag(999999)])
+    section = get_exam(client, exam_id)["examSections"][0]
+    remove_question(client, exam_id, section["id"], ids[0])
+    assert sorted(question["id"] for question in collect_garbage(client, 2, dry_run=True)) == [ids[0], lost["id"]]
+    assert len(get_questions(client)) == 11
+    quiet(collect_garbage, client, 2)
+    assert sorted(question["id"] for question in get_questions(client)) == ids[1:]
+    assert collect_garbage(client) == []
+
+    # A question edited in EXAM no longer has the content of its hash tag, so it is replaced instead of reused
+    server.exam.questions[ids[1]]["question"] = "<p>Edited in EXAM</p>"
+    quiet(import_exam, client, exam_id, 1, exam, jobs=4)
+    assert ids[1] not in {question["id"] for question in get_questions(client)}
+    assert [html for html, options in layout(client, exam_id)[0][2]] == [question["html"] for question in exam[0]["questions"]]
+
+def test_watch_syncs_on_save(server, tmp_path):
+    import threading, time
+    from examtool.watch import watch_exam
+    client = Session()
+    exam_id = server.exam.add_exam()
+    path = tmp_path / "exam.typ"
+    question = "== q{0}\nQuestion {0}\n+ right (correct)\n+ wrong\n"
+    path.write_text("= One\n" + question.format(1) + question.format(2) + "= Two\n" + question.format(3))
+
+    def wait_for(condition):
+        deadline = time.time() + 10
+        while not condition():
+            assert time.time() < deadline
+            time.sleep(0.02)
+
+    stop = threading.Event()
+    watcher = threading.Thread(target=quiet, args=(watch_exam, client, exam_id, 1, str(path)), kwargs={"debounce": 0.3, "interval": 0.01, "stop": stop})
+    watcher.start()
+    try:
+        wait_for(lambda: [len(questions) for name, description, questions in layout(client, exam_id)] == [2, 1])
+        ids = [sq["question"]["id"] for section in get_exam(client, exam_id)["examSections"] for sq in section["sectionQuestions"]]
+        writes = lambda: {endpoint: n for endpoint, n in server.counts.items() if not endpoint.startswith("GET")}
+        before = writes()
+        # Several quick saves are synced once, with only the changed question
+        for old, new in (("Question 3\n", "Question 3 draft\n"), ("draft", "edited")):
+            path.write_text(path.read_text().replace(old, new))
+        wait_for(lambda: layout(client, exam_id)[1][2][0][0] == "<p>Question 3 edited</p>")
+        time.sleep(0.2)
+        assert [sq["question"]["id"] for section in get_exam(client, exam_id)["examSections"] for sq in section["sectionQuestions"]] == ids
+        assert writes() == {**before, r"PUT /app/questions/(\d+)": 1}
+    finally:
+        stop.set()
+        watcher.join()
+
+def test_streaming_json():
+    data = [{"id": i, "tags": [{"name": "ä✓" * i}], "text": 'a"]},[', "x": [1.5e3, -12, None]} for i in range(20)] + [123456, 0.25, True]
+    raw = json.dumps(data).encode()
+    for size in (1, 3, 64):
+        assert list(sdk.iter_json_array(raw[i:i + size] for i in range(0, len(raw), size))) == data
+    assert list(sdk.iter_json_array([b'[{"id": 1, "a": 2}, ', b'{"b": 3}]'], ["id", "b"])) == [{"id": 1}, {"b": 3}]
+    for broken in (b"[1, 2", b"{}", b"[1 2]"):
+        with pytest.raises(json.JSONDecodeError):
+            list(sdk.iter_json_array([broken]))
+
+def test_iter_questions(server):
+    client = Session()
+    quiet(import_exam, client, server.exam.add_exam(), 1, synthetic_exam(30), jobs=4)
+    questions = get_questions(client)
+    assert list(iter_questions(client)) == questions
+    assert list(iter_questions(client, ["id", "tags"])) == [{"id": q["id"], "tags": q["tags"]} for q in questions]
+    assert list(iter_exams(client, ["id"])) == [{"id": exam["id"]} for exam in get_exams(client)]
+
+    stdout = io.StringIO()
+    with contextlib.redirect_stdout(stdout):
+        cli.get_questions_command(client, cli.make_parser().parse_args(["get", "questions", "--fields", "id"]))
+    assert json.loads(stdout.getvalue()) == [{"id": q["id"]} for q in questions]
+
+    # Neither the retries nor the profiler read a streamed body before the caller does
+    recorder = Recorder()
+    session = recorder.install(ExamSession())
+    with session.get(f"{sdk.base_url}/app/questions", headers=sdk.headers, stream=True) as resp:
+        assert not resp._content_consumed
+        assert recorder.records[-1]["bytes"] == int(resp.headers["Content-Length"]) > 0
+    assert list(iter_questions(session)) == questions
+
+def test_validation_collects_every_error():
+    exam = synthetic_exam(4, questions_per_section=2)
+    exam[0]["questions"][0]["options"] = exam[0]["questions"][0]["options"][:1]
+    exam[0]["questions"][1]["options"][0]["correctOption"] = False
+    exam[1].update(lotteryOn=True, lotteryItemCount=5)
+    del exam[1]["questions"][1]["html"]
+    with pytest.raises(ExamValidationError) as err:
+        validate_exam(exam)
+    assert err.value.errors == [
+        "section 1 question 1: number of options < 2",
+        "section 1 question 2: missing correct option",
+        "section 2 question 2: html must be a string",
+        "section 2: lotteryItemCount > number of questions (2)",
+    ]
+
+def test_jsonl_ir(server, tmp_path, monkeypatch):
+    exam = synthetic_exam(12, questions_per_section=5)
+    exam[1].update(lotteryOn=True, lotteryItemCount=2)
+    exam[2]["questions"][0]["points"] = 2
+    sections = validate_exam(exam)
+    assert sections == exam and all(not hasattr(section, "__dict__") for section in sections)
+    jsonl = io.StringIO()
+    write_jsonl_exam(sections, jsonl)
+    lines = jsonl.getvalue().splitlines(keepends=True)
+    assert len(lines) == 3 + 12 + 1 and json.loads(lines[-1]) == {"type": "end", "sections": 3, "questions": 12}
+    assert read_exam(io.StringIO(jsonl.getvalue())) == exam
+    assert read_exam(io.StringIO("\n" + json.dumps(exam))) == exam
+    with pytest.raises(ExamValidationError, match="line 2: question outside of a section"):
+        read_exam(io.StringIO('\n{"type": "question", "html": "", "options": []}\n{"type": "end", "sections": 0, "questions": 1}\n'))
+    # Empty, cut short or miscounted input is never imported in part
+    for broken, error in [
+        ([], "the input is empty"),
+        (["\n"], "the input is empty"),
+        (lines[:-1], "line 15: the input ends without an end record"),
+        (lines[:7] + lines[-1:], "line 8: the end record counts 3 sections and 12 questions, but 2 and 5 were read"),
+        (lines + lines[:1], "line 17: record after the end record"),
+    ]:
+        with pytest.raises(ExamValidationError, match=error):
+            read_exam(io.StringIO("".join(broken)))
+
+    # Piped into import, e.g. from typst_exam --jsonl
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.setattr(sys, "stdin", io.StringIO(jsonl.getvalue()))
+    client = Session()
+    exam_id, reference = server.exam.add_exam(), server.exam.add_exam()
+    parser = cli.make_parser()
+    args = parser.parse_args(["import", str(exam_id), "1", "-"])
+    args.parser = parser
+    quiet(cli.import_command, client, args)
+    quiet(import_exam, client, reference, 1, exam, jobs=4)
+    assert layout(client, exam_id) == layout(client, reference)
+
+    # Nothing on the standard input, e.g. when typst_exam failed before its first record
+    monkeypatch.setattr(sys, "stdin", io.StringIO(""))
+    with pytest.raises(SystemExit), contextlib.redirect_stderr(io.StringIO()) as stderr:
+        cli.import_command(client, args)
+    assert "the input is empty" in stderr.getvalue()
+    assert layout(client, exam_id) == layout(client, reference)
+
+def test_async_sdk(server):
+    pytest.importorskip("aiohttp")
+    import asyncio, requests
+    from examtool import aio
+    exam_id = server.exam.add_exam()
+    options = [{"option": "right", "correctOption": True}, {"option": "wrong"}]
+
+    async def build():
+        async with aio.AsyncExamSession(pool_size=8) as client:
+            section = await aio.create_section(client, exam_id)
+            await aio.edit_section(client, exam_id, section["id"], "Async", "")
+            # A single event loop drives all of the creates at once, 8 connections at a time
+            questions = await asyncio.gather(*(aio.create_question(client, 1, 1, f"<p>{i}</p>", options, ["async"]) for i in range(100)))
+            for i, question in enumerate(questions):
+                await aio.add_question(client, exam_id, section["id"], i, question["id"])
+            await aio.remove_question(client, exam_id, section["id"], questions[0]["id"])
+            await aio.delete_question(client, questions[0]["id"])
+            edited = await aio.edit_question(client, questions[1]["id"], 1, 2, "<p>Edited</p>", [{"id": op["id"], **op} for op in questions[1]["options"]], ["async"])
+            assert edited["defaultMaxScore"] == 2
+            exams = await aio.fetch_exams(client, [exam_id, exam_id])
+            assert len(await aio.get_questions(client)) == 99 and exams[0] == exams[1] == await aio.get_exam(client, exam_id)
+            assert [exam["id"] for exam in await aio.get_exams(client)] == [exam["id"] for exam in get_exams(Session())]
+            with pytest.raises(requests.HTTPError) as err:
+                await aio.get_exam(client, 999999)
+            return exams[0], err.value
+
+    exam, error = asyncio.run(build())
+    assert exam == get_exam(Session(), exam_id)
+    assert [sq["question"]["question"] for sq in exam["examSections"][0]["sectionQuestions"]][:2] == ["<p>Edited</p>", "<p>2</p>"]
+    # Errors are the same as those of the blocking SDK
+    with pytest.raises(requests.HTTPError) as err:
+        get_exam(Session(), 999999)
+    assert str(error) == str(err.value) and error.response.status_code == 404
@@ -0,0 +1,130 @@
+import random, threading, time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from .sdk import is_login, is_csrf_error
+
+# Statuses worth retrying. POSTs are only retried on the ones where the server has not processed the request,
+# as retrying e.g. a `create_question` after a 500 could create the question twice. A 502 or 504 from a gateway
+# may come after the request was processed, so those are not retried either.
+retryable_statuses = {429, 500, 502, 503, 504}
+retryable_post_statuses = {429, 503}
+idempotent_methods = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+class ConnectFailedError(requests.ConnectionError):
+    """
+    Raised by clients other than `requests`, e.g. `examtool.aio`, when no connection could be made, so that the
+    request was never sent.
+    """
+
+class TokenBucket:
+    """
+    Thread-safe token bucket allowing on average `rate` acquisitions per second, with bursts of up to `burst`.
+    """
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes a token and returns how many seconds to wait before using it.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Reserve the token now and wait outside the lock, so that waiters are served in order
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def acquire(self):
+        """
+        Takes a token, sleeping until one is available.
+        """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+def is_retryable(method: str, response: requests.Response):
+    """
+    Whether a request that got `response` should be sent again.
+
+    Login and CSRF error pages are never retried: they are reported by `handle_error_response`, and only fresh
+    cookies help with them. The body is only read for those checks when the status is worth retrying, so that
+    successful responses can still be streamed.
+    """
+    statuses = retryable_statuses if method.upper() in idempotent_methods else retryable_post_statuses
+    if response.status_code not in statuses:
+        return False
+    return not (is_login(response) or is_csrf_error(response))
+
+def is_connect_error(err: requests.RequestException):
+    """
+    Whether the request failed before it was sent, because no connection could be made.
+    """
+    if isinstance(err, (requests.exceptions.ConnectTimeout, ConnectFailedError)):
+        return True
+    reason = getattr(err.args[0], "reason", None) if err.args else None
+    return isinstance(err, requests.ConnectionError) and isinstance(reason, NewConnectionError)
+
+def is_retryable_error(method: str, err: requests.RequestException):
+    """
+    Whether a request that failed with `err` before getting a response should be sent again.
+    """
+    if is_connect_error(err):
+        # The request was never sent
+        return True
+    if method.upper() in idempotent_methods:
+        return isinstance(err, (requests.ConnectionError, requests.Timeout))
+    return False
+
+def retry_delay(attempt: int, backoff: float, max_backoff: float, response: requests.Response = None):
+    """
+    Seconds to wait before retry number `attempt + 1`: exponential backoff with full jitter, or the `Retry-After` of
+    the response.
+    """
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(max_backoff, int(retry_after))
+    return random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+
+class ExamSession(requests.Session):
+    """
+    A `requests.Session` for talking to EXAM from many threads.
+
+    - Keeps up to `pool_size` connections alive per host; size it to the number of concurrent workers.
+    - Sends at most `rate` requests per second on average, when given.
+    - Retries transient failures up to `retries` times with exponential backoff and full jitter, starting from
+      `backoff` seconds and capped at `max_backoff`. A `Retry-After` header from the server takes precedence.
+    """
+    def __init__(self, pool_size: int = 10, rate: float = None, burst: int = None, retries: int = 5, backoff: float = 0.5, max_backoff: float = 30):
+        super().__init__()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self.rate_limiter = TokenBucket(rate, burst) if rate else None
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt: int, response: requests.Response = None):
+        return retry_delay(attempt, self.backoff, self.max_backoff, response)
+
+    def request(self, method, url, *args, **kwargs):
+        for attempt in range(self.retries + 1):
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except requests.RequestException as err:
+                if attempt == self.retries or not is_retryable_error(method, err):
+                    raise
+                time.sleep(self.delay(attempt))
+                continue
+            if attempt == self.retries or not is_retryable(method, response):
+                return response
+            response.close()
+            time.sleep(self.delay(attempt, response))
@@ -0,0 +1,74 @@
+import os, threading, time
+from .importer import ExamValidationError, validate_exam, sync_exam
+
+def file_stamp(path: str):
+    """
+    What changes when the file is saved, also by editors that replace it, or None if it does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+def watch_file(path: str, debounce: float = 0.5, interval: float = 0.2, stop: threading.Event = None):
+    """
+    Yields the contents of the file at `path` right away and then after every change, until `stop` is set.
+
+    The file is polled every `interval` seconds. A change is only yielded once the file has not changed for `debounce`
+    seconds, so that a burst of saves yields once, with the last version.
+    """
+    stop = stop or threading.Event()
+    seen = None
+    while not stop.is_set():
+        stamp = file_stamp(path)
+        if stamp != seen:
+            while not stop.wait(debounce):
+                settled = file_stamp(path)
+                if settled == stamp:
+                    break
+                stamp = settled
+            else:
+                return
+            seen = stamp
+            if stamp:
+                with open(path) as f:
+                    yield f.read()
+        stop.wait(interval)
+
+def watch_exam(client, exam_id: int, owner_id: int, path: str, jobs: int = 1, debounce: float = 0.5, interval: float = 0.2,
+               render=None, stop: threading.Event = None):
+    """
+    Syncs exam `exam_id` from the typst EXAM source at `path` now and every time it is saved, until `stop` is set or
+    the user interrupts.
+
+    Only the sections that changed are parsed again (see `typst_exam.IncrementalParser`), and `sync_exam` sends only
+    the requests for the questions and sections that differ in EXAM. Versions that do not parse or validate are
+    reported and skipped, and a failed sync is tried again at the next save.
+    """
+    from typst_exam import IncrementalParser, TypstExamError, to_html
+    parser = IncrementalParser(render or to_html)
+    synced = None
+    try:
+        for source in watch_file(path, debounce, interval, stop):
+            start = time.perf_counter()
+            try:
+                exam = validate_exam(parser.parse(source))
+            except (TypstExamError, ExamValidationError) as err:
+                print(f"Not synced, {path} is invalid: {err}")
+                continue
+            if exam == synced:
+                print("Nothing changed")
+                continue
+            if synced is not None:
+                print(f"Parsed sections {', '.join(str(i + 1) for i in parser.changed) or 'none'} again")
+            try:
+                sync_exam(client, exam_id, owner_id, exam, jobs)
+            except Exception as err:
+                synced = None
+                print(f"Sync failed, trying again at the next save: {err}")
+                continue
+            synced = exam
+            print(f"Synced exam {exam_id} in {time.perf_counter() - start:.1f} s, waiting for changes to {path}")
+    except KeyboardInterrupt:
+        pass
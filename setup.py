@@ -5,9 +5,10 @@ setup(
     version='0.1.0',
     packages=['examtool', 'typst_exam'],
     install_requires=['requests', 'markdown'],
+    extras_require={'async': ['aiohttp']},
     entry_points={
         'console_scripts': [
-            'examtool = examtool:main',
+            'examtool = examtool.cli:main',
             'typst_exam = typst_exam:main',
         ]
     },
@@ -1,89 +1,251 @@
-import re, markdown
-from examtool.sdk import *
-from examtool import init_client
+import copy, os, re
+from .render import HtmlRenderer, shared_markdown, default_cache_path
+
+section_pattern = re.compile(r'^= (.+?)( \(lottery ([0-9]+)\))?$')
+question_pattern = re.compile(r'^==.*$')
+option_pattern = re.compile(r'^\+ (.+?)( \((correct)\))?$')
+
+class TypstExamError(ValueError):
+    """
+    Raised for typst EXAM source that cannot be parsed, with the offending line number.
+    """
+    def __init__(self, line_number: int, message: str):
+        super().__init__(f"line {line_number}: {message}")
+        self.line_number = line_number
 
 def to_html(typst: str):
     """
     Currently we simply use markdown to convert typst into HTML
+
+    Use `render.HtmlRenderer` to cache the results on disk.
     """
-    return markdown.markdown(typst, extensions=['fenced_code'])
+    return shared_markdown().reset().convert(typst)
 
-def parse_typst_exam(typst_code):
-    sections = []
-    current_section = None
-    current_question = None
-    
-    lines = typst_code.strip().splitlines()
-    section_pattern = re.compile(r'^= (.+?)( \(lottery ([0-9]+)\))?$')
-    question_pattern = re.compile(r'^==.*$')
-    option_pattern = re.compile(r'^\+ (.+?)( \((correct)\))?$')
+def stripped_lines(lines):
+    """
+    Yields `(line_number, line)` for the lines of a file object or other iterable of lines, without line endings.
+
+    Like `str.strip` on the whole source, leading and trailing whitespace of the source is dropped. The lines are
+    consumed lazily: only the whitespace-only lines since the last other line are held back.
+    """
+    previous = None
+    blank = []
+    for line_number, line in enumerate(lines, 1):
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            if previous is not None:
+                blank.append((line_number, line))
+            continue
+        if previous is None:
+            line = line.lstrip()
+        else:
+            yield previous
+            yield from blank
+            blank = []
+        previous = (line_number, line)
+    if previous is not None:
+        yield previous[0], previous[1].rstrip()
+
+def iter_typst_exam(lines, render=to_html):
+    """
+    Parses typst EXAM source line by line, yielding `("section", section)` and `("question", question)` as soon as they close.
 
-    for line in lines:
+    A section is yielded without its questions once its description is complete, i.e. at its first question or at its
+    end. The questions that follow it belong to it, and are yielded with their HTML already rendered by `render`.
+    Only the section or question being parsed is held in memory, so arbitrarily large sources parse in bounded memory.
+    """
+    return iter_numbered_exam(stripped_lines(lines), render)
+
+def iter_numbered_exam(numbered_lines, render=to_html):
+    """
+    Like `iter_typst_exam`, but for `(line_number, line)` pairs of `stripped_lines`.
+    """
+    section = None
+    description = None # lines of the current section description, until its first question
+    question = None
+    text = None # lines of the current question
+
+    def close_question():
+        question["typst"] = "".join(text)
+        question["html"] = render(question["typst"])
+        return ("question", question)
+
+    def close_description():
+        section["description"] = "".join(description)
+        return ("section", section)
+
+    for line_number, line in numbered_lines:
         section_match = section_pattern.match(line)
         if section_match:
-            if current_section:
-                if current_question:
-                    current_section["questions"].append(current_question)
-                    current_question = None
-                sections.append(current_section)
-            
-            current_section = {
+            if question:
+                yield close_question()
+                question = None
+            elif description is not None:
+                yield close_description()
+
+            section = {
                 # EXAM does not support HTML in name or description
                 "name": section_match.group(1),
                 "description": "",
                 "questions": []
             }
+            description = []
             count = section_match.group(3)
             if count:
-                current_section["lotteryOn"] = True
-                current_section["lotteryItemCount"] = int(count)
+                section["lotteryOn"] = True
+                section["lotteryItemCount"] = int(count)
             continue
-        
+
         question_match = question_pattern.match(line)
         if question_match:
-            if current_question:
-                current_section["questions"].append(current_question)
-                
-            current_question = {
+            if section is None:
+                raise TypstExamError(line_number, "question outside of a section")
+            if question:
+                yield close_question()
+            elif description is not None:
+                yield close_description()
+                description = None
+
+            question = {
                 "typst": "",
                 "options": []
             }
+            text = []
             continue
-        
+
         option_match = option_pattern.match(line)
         if option_match:
+            if question is None:
+                raise TypstExamError(line_number, "option outside of a question")
             option = option_match.group(1)
             correct = bool(option_match.group(3))
-            current_question["options"].append({"option": option, "correctOption": correct})
+            question["options"].append({"option": option, "correctOption": correct})
             continue
 
-        if current_question:
-            current_question["typst"] += line + "\n"
-        elif current_section:
-            current_section["description"] += line + "\n"
-    
-    # Appending leftover section and question
-    if current_question:
-        current_section["questions"].append(current_question)
-        
-    if current_section:
-        sections.append(current_section)
-    
-    for section in sections:
-        for question in section['questions']:
-            question['html'] = to_html(question['typst'])
-
-    return sections
+        if question:
+            text.append(line + "\n")
+        elif section:
+            description.append(line + "\n")
+
+    # Closing leftover section and question
+    if question:
+        yield close_question()
+    elif description is not None:
+        yield close_description()
+
+def iter_typst_sections(lines, render=to_html):
+    """
+    Parses typst EXAM source line by line, yielding each section with its questions as soon as it closes.
+    """
+    return group_sections(iter_typst_exam(lines, render))
+
+def group_sections(events):
+    """
+    Turns the events of `iter_typst_exam` into sections with their questions.
+    """
+    section = None
+    for kind, item in events:
+        if kind == "section":
+            if section:
+                yield section
+            section = item
+        else:
+            section["questions"].append(item)
+    if section:
+        yield section
+
+def parse_typst_exam(typst_code, render=to_html):
+    return list(iter_typst_sections(typst_code.splitlines(), render))
+
+def typst_regions(lines):
+    """
+    Splits typst EXAM source into regions that parse independently of each other: whatever comes before the first
+    section, and then each section with its questions. Returns lists of `(line_number, line)` like `stripped_lines`.
+    """
+    regions = [[]]
+    for line_number, line in stripped_lines(lines):
+        if section_pattern.match(line):
+            regions.append([])
+        regions[-1].append((line_number, line))
+    return regions
+
+class IncrementalParser:
+    """
+    Parses successive versions of the same typst EXAM source, such as an exam being edited, re-parsing only what changed.
+
+    The sections of the last version are remembered by their source text (see `typst_regions`), and the HTML of its
+    questions by their typst, so that a new version only parses the sections that differ and only renders the
+    questions that differ. `changed` is the indices of the sections that the last `parse` had to parse.
+    """
+    def __init__(self, render=to_html):
+        self.render = render
+        self.sections = {}
+        self.html = {}
+        self.changed = []
+
+    def parse(self, typst_code: str):
+        sections, parsed, html, self.changed = [], {}, {}, []
+
+        def render(typst):
+            if typst not in html:
+                html[typst] = self.html[typst] if typst in self.html else self.render(typst)
+            return html[typst]
+
+        for region in typst_regions(typst_code.splitlines()):
+            text = "\n".join(line for line_number, line in region)
+            if text not in parsed:
+                if text in self.sections:
+                    parsed[text] = self.sections[text]
+                    html.update((question["typst"], question["html"]) for section in parsed[text] for question in section["questions"])
+                else:
+                    parsed[text] = list(group_sections(iter_numbered_exam(region, render)))
+                    self.changed += range(len(sections), len(sections) + len(parsed[text]))
+            sections += copy.deepcopy(parsed[text])
+        self.sections = parsed
+        self.html = html
+        return sections
 
 def main():
-    import argparse
+    import argparse, sys
     from json import dumps
+    from .batch import OutputConflictError, build_all, default_manifest_path
     parser = argparse.ArgumentParser()
-    parser.add_argument("path", help="Typst EXAM file path")
+    parser.add_argument("path", nargs="+", help="Typst EXAM file path. With several paths, directories or --output-dir, every file is converted into a JSON file of its own.")
+    parser.add_argument("--no-cache", action="store_true", help="Do not use the on-disk cache of rendered HTML")
+    parser.add_argument("-o", "--output-dir", help="Directory for the JSON files in batch mode. By default each one is written next to its source.")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes in batch mode (default: number of CPUs)")
+    parser.add_argument("--force", action="store_true", help="Rebuild also the files that have not changed since the last build")
+    parser.add_argument("--jsonl", action="store_true", help="Write the IR of a single file as JSON Lines, a record per section and question as soon as it is parsed and an end record once the whole file is, e.g. to pipe it into `examtool import`")
     args = parser.parse_args()
-    with open(args.path) as f: s = f.read()
-    print(dumps(parse_typst_exam(s)))
 
+    cache_path = None if args.no_cache else default_cache_path()
+    if len(args.path) > 1 or args.output_dir or os.path.isdir(args.path[0]):
+        if args.jsonl:
+            parser.error("--jsonl works only with a single file")
+        try:
+            failed = build_all(args.path, args.output_dir, args.jobs, args.force, cache_path, default_manifest_path())
+        except OutputConflictError as err:
+            parser.error(str(err))
+        sys.exit(1 if failed else 0)
+
+    with open(args.path[0]) as f, HtmlRenderer(cache_path) as renderer:
+        if args.jsonl:
+            from examtool.ir import end_record
+            counts = {"section": 0, "question": 0}
+            for kind, item in iter_typst_exam(f, renderer.render):
+                # The questions of a section are the question records that follow it
+                record = {"type": kind, **{key: value for key, value in item.items() if key != "questions"}}
+                sys.stdout.write(dumps(record) + "\n")
+                sys.stdout.flush()
+                counts[kind] += 1
+            # Only a file that parsed to the end gets the end record, so that readers reject a failed conversion
+            sys.stdout.write(dumps(end_record(counts["section"], counts["question"])) + "\n")
+            return
+        # Same output as dumps(parse_typst_exam(...)), written one section at a time
+        sys.stdout.write("[")
+        for i, section in enumerate(iter_typst_sections(f, renderer.render)):
+            sys.stdout.write((", " if i else "") + dumps(section))
+        sys.stdout.write("]\n")
 
 if __name__=="__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,143 @@
+import hashlib, json, os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from examtool.paths import cache_dir
+from . import iter_typst_sections
+from .render import HtmlRenderer, extensions
+
+class OutputConflictError(ValueError):
+    """
+    Raised when two sources would be built into the same output file.
+    """
+
+def build_config():
+    """
+    Changing any of these must rebuild everything.
+    """
+    import markdown
+    return {"markdown": markdown.__version__, "extensions": extensions, "version": 1}
+
+def default_manifest_path():
+    return os.path.join(cache_dir(), "typst_exam-builds.json")
+
+def find_sources(paths: list):
+    """
+    Returns `(source, root)` for the given files and the `.typ` files under the given directories.
+
+    `root` is the directory the source was found under, or None for files given directly.
+    """
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                sources += [(os.path.join(dirpath, name), path) for name in sorted(filenames) if name.endswith(".typ")]
+        else:
+            sources.append((path, None))
+    return sources
+
+def output_path(source: str, root: str, output_dir: str = None):
+    """
+    `exam.typ` becomes `exam.json` next to it, or under `output_dir` keeping its path relative to `root`.
+    """
+    name = os.path.splitext(source)[0] + ".json"
+    if output_dir is None:
+        return name
+    return os.path.join(output_dir, os.path.relpath(name, root) if root else os.path.basename(name))
+
+def check_outputs(outputs: list):
+    """
+    Raises `OutputConflictError` naming both sources if two different sources of `(source, output)` share an output.
+    """
+    seen = {}
+    for source, output in outputs:
+        other = seen.setdefault(os.path.abspath(output), source)
+        if os.path.abspath(other) != os.path.abspath(source):
+            raise OutputConflictError(f"{other} and {source} would both be built into {output}")
+
+def file_digest(path: str):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def build(source: str, output: str, cache_path: str = None):
+    """
+    Parses and renders `source` into the EaC IR file `output`. Run in a worker process.
+    """
+    tmp = f"{output}.{os.getpid()}.tmp"
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    try:
+        with open(source) as f, HtmlRenderer(cache_path) as renderer, open(tmp, "w") as out:
+            out.write("[")
+            for i, section in enumerate(iter_typst_sections(f, renderer.render)):
+                out.write((", " if i else "") + json.dumps(section))
+            out.write("]\n")
+        os.replace(tmp, output)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def is_up_to_date(entry: dict, source: str, output: str, stat: os.stat_result):
+    """
+    Whether `output` was built from the current `source`, by modification time or, if that changed, by content hash.
+    """
+    if not entry or entry.get("config") != build_config() or entry.get("output") != output or not os.path.exists(output):
+        return False
+    if (entry["mtime_ns"], entry["size"]) == (stat.st_mtime_ns, stat.st_size):
+        return True
+    if entry["sha256"] == file_digest(source):
+        entry["mtime_ns"], entry["size"] = stat.st_mtime_ns, stat.st_size
+        return True
+    return False
+
+def build_all(paths: list, output_dir: str = None, jobs: int = None, force: bool = False, cache_path: str = None, manifest_path: str = None):
+    """
+    Builds the EaC IR of every typst EXAM source in `paths` across a pool of `jobs` processes.
+
+    Sources that have not changed since they were last built, according to the manifest, are skipped unless `force`.
+    Returns a list of `(source, error)` for the sources that failed. Raises `OutputConflictError` before building
+    anything if two sources would be built into the same file, e.g. `a/exam.typ` and `b/exam.typ` with `output_dir`.
+    """
+    manifest = {}
+    if manifest_path and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    outputs = [(source, output_path(source, root, output_dir)) for source, root in find_sources(paths)]
+    check_outputs(outputs)
+    todo, keys = [], set()
+    for source, output in outputs:
+        key = os.path.abspath(source)
+        if key in keys:
+            # Given twice, e.g. directly and under a directory
+            continue
+        keys.add(key)
+        stat = os.stat(source)
+        if not force and is_up_to_date(manifest.get(key), source, output, stat):
+            print(f"Up to date {source}")
+            continue
+        manifest.pop(key, None)
+        todo.append((source, output, key, stat))
+
+    failed = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(build, source, output, cache_path): (source, output, key, stat) for source, output, key, stat in todo}
+        for future in as_completed(futures):
+            source, output, key, stat = futures[future]
+            try:
+                future.result()
+            except Exception as err:
+                print(f"Failed {source}: {err}")
+                failed.append((source, err))
+                continue
+            print(f"Built {source} -> {output}")
+            manifest[key] = {"output": output, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": file_digest(source), "config": build_config()}
+
+    if manifest_path:
+        os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+        tmp = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, manifest_path)
+    return failed
@@ -0,0 +1,103 @@
+import hashlib, json, os, sqlite3, threading, time
+from examtool.paths import cache_dir
+
+extensions = ['fenced_code']
+
+local = threading.local()
+
+def shared_markdown():
+    """
+    Returns this thread's `markdown.Markdown` instance, which is reset and reused for every conversion.
+    """
+    if not hasattr(local, "md"):
+        import markdown
+        local.md = markdown.Markdown(extensions=extensions)
+    return local.md
+
+def default_cache_path():
+    return os.path.join(cache_dir(), "html.sqlite3")
+
+class HtmlRenderer:
+    """
+    Converts typst into HTML, remembering the results in an SQLite database at `cache_path`.
+
+    Results are keyed by a hash of the source and of the markdown version and extensions, so that changing either
+    renders everything again. New results are kept in memory and written in one short transaction on `flush`, so
+    that processes sharing the cache never wait for each other to render. When the cache grows over `max_size` bytes,
+    the least recently used results are evicted on `close`. Not thread-safe: use one renderer per thread or process.
+    """
+    def __init__(self, cache_path: str = None, max_size: int = 64 * 1024 * 1024):
+        import markdown
+        self.md = markdown.Markdown(extensions=extensions)
+        self.config = json.dumps({"markdown": markdown.__version__, "extensions": extensions})
+        self.max_size = max_size
+        self.used = {}
+        self.rendered = {}
+        self.db = None
+        if cache_path:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            self.db = sqlite3.connect(cache_path, timeout=30)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS html (key TEXT PRIMARY KEY, html TEXT NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)")
+
+    def key(self, typst: str):
+        return hashlib.sha256(f"{self.config}\0{typst}".encode()).hexdigest()
+
+    def render(self, typst: str):
+        if self.db is None:
+            return self.md.reset().convert(typst)
+        key = self.key(typst)
+        if key in self.rendered:
+            return self.rendered[key]
+        row = self.db.execute("SELECT html FROM html WHERE key = ?", (key,)).fetchone()
+        if row:
+            # Recency is written back in one go on flush
+            self.used[key] = time.time()
+            return row[0]
+        html = self.rendered[key] = self.md.reset().convert(typst)
+        if len(self.rendered) >= 100:
+            self.flush()
+        return html
+
+    def evict(self):
+        """
+        Deletes the least recently used results until the cache fits in `max_size`.
+        """
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM html").fetchone()[0]
+        if total <= self.max_size:
+            return
+        stale = []
+        for key, size in self.db.execute("SELECT key, size FROM html ORDER BY used"):
+            if total <= self.max_size:
+                break
+            stale.append((key,))
+            total -= size
+        self.db.executemany("DELETE FROM html WHERE key = ?", stale)
+
+    def flush(self):
+        """
+        Writes the results rendered so far and the recency of the cached results to the database.
+        """
+        if self.db is None:
+            return
+        now = time.time()
+        self.db.executemany("INSERT OR REPLACE INTO html VALUES (?, ?, ?, ?)", [(key, html, len(key) + len(html.encode()), now) for key, html in self.rendered.items()])
+        self.db.executemany("UPDATE html SET used = ? WHERE key = ?", [(used, key) for key, used in self.used.items()])
+        self.db.commit()
+        self.rendered = {}
+        self.used = {}
+
+    def close(self):
+        if self.db is None:
+            return
+        self.flush()
+        self.evict()
+        self.db.commit()
+        self.db.close()
+        self.db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,3 +1,5 @@
+import io, json, os, subprocess, sys
+import pytest
 from unittest import TestCase
 from typst_exam import *
 
@@ -28,4 +30,116 @@ def test_example():
                 }
             ]
         }
-    ]
\ No newline at end of file
+    ]
+
+def test_streaming():
+    events = iter_typst_exam(io.StringIO(example_typst_code + "= empty\n"))
+    assert next(events) == ("section", {"name": "h", "description": "a\n", "lotteryOn": True, "lotteryItemCount": 1, "questions": []})
+    kind, question = next(events)
+    assert kind == "question" and question["html"] == "<p>p</p>"
+    assert next(events) == ("section", {"name": "empty", "description": "", "questions": []})
+    assert list(events) == []
+
+def test_error_line_number():
+    with pytest.raises(TypstExamError, match="line 5: option outside of a question"):
+        parse_typst_exam(example_typst_code.replace("== q\n", ""))
+
+def test_html_cache(tmp_path):
+    from typst_exam.render import HtmlRenderer
+    path = str(tmp_path / "html.sqlite3")
+    with HtmlRenderer(path) as renderer:
+        assert parse_typst_exam(example_typst_code, renderer.render)[0]["questions"][0]["html"] == "<p>p</p>"
+        assert renderer.render("*b*") == to_html("*b*")
+
+    with HtmlRenderer(path, max_size=0) as renderer:
+        renderer.md = None # everything must come from the cache
+        assert renderer.render("p\n") == "<p>p</p>"
+        assert renderer.render("*b*") == "<p><em>b</em></p>"
+
+    with HtmlRenderer(path) as renderer:
+        assert renderer.db.execute("SELECT COUNT(*) FROM html").fetchone()[0] == 0
+
+def test_shared_html_cache(tmp_path):
+    import time
+    from typst_exam.render import HtmlRenderer
+    path = str(tmp_path / "html.sqlite3")
+    with HtmlRenderer(path) as a, HtmlRenderer(path) as b:
+        # A renderer in the middle of rendering does not lock out the others sharing the cache
+        assert a.render("*a*") == "<p><em>a</em></p>"
+        start = time.perf_counter()
+        b.render("*b*")
+        b.flush()
+        assert time.perf_counter() - start < 1
+        a.flush()
+        assert a.db.execute("SELECT COUNT(*) FROM html").fetchone()[0] == 2
+
+def test_batch(tmp_path):
+    from typst_exam.batch import build_all
+    sources = tmp_path / "exams"
+    (sources / "2025").mkdir(parents=True)
+    (sources / "a.typ").write_text(example_typst_code)
+    (sources / "2025" / "b.typ").write_text(example_typst_code.replace("p\n", "q\n"))
+    out, manifest = tmp_path / "out", str(tmp_path / "manifest.json")
+
+    assert build_all([str(sources)], str(out), jobs=2, manifest_path=manifest) == []
+    assert json.loads((out / "a.json").read_text()) == parse_typst_exam(example_typst_code)
+    assert json.loads((out / "2025" / "b.json").read_text())[0]["questions"][0]["html"] == "<p>q</p>"
+
+    built = (out / "a.json").stat().st_mtime_ns
+    os.utime(sources / "a.typ") # touched but not changed
+    (sources / "2025" / "b.typ").write_text("== outside\n")
+    failed = build_all([str(sources)], str(out), jobs=2, manifest_path=manifest)
+    assert [os.path.basename(source) for source, err in failed] == ["b.typ"]
+    assert (out / "a.json").stat().st_mtime_ns == built
+
+def test_batch_output_conflict(tmp_path):
+    from typst_exam.batch import OutputConflictError, build_all
+    for course in ("a", "b"):
+        (tmp_path / course).mkdir()
+        (tmp_path / course / "exam.typ").write_text(example_typst_code.replace("p\n", f"{course}\n"))
+    a, b = str(tmp_path / "a" / "exam.typ"), str(tmp_path / "b" / "exam.typ")
+    out, manifest = tmp_path / "out", tmp_path / "manifest.json"
+    for paths in ([a, b], [str(tmp_path / "a"), str(tmp_path / "b")]):
+        with pytest.raises(OutputConflictError, match=f"{a} and {b} would both be built into"):
+            build_all(paths, str(out), jobs=2, manifest_path=str(manifest))
+    assert not out.exists() and not manifest.exists()
+    # Without --output-dir each is built next to its source
+    assert build_all([a, b, a], jobs=2) == []
+    assert json.loads((tmp_path / "b" / "exam.json").read_text())[0]["questions"][0]["html"] == "<p>b</p>"
+
+def test_lazy_imports():
+    code = "import sys, typst_exam; print(sorted({'requests', 'markdown', 'examtool.sdk', 'examtool.cache'} & set(sys.modules)))"
+    assert subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout == "[]\n"
+
+def test_incremental_parser():
+    source = example_typst_code + "\n= second\n== q2\nr\n+ b1 (correct)\n+ b2\n"
+    rendered = []
+    parser = IncrementalParser(lambda typst: rendered.append(typst) or to_html(typst))
+    assert parser.parse(source) == parse_typst_exam(source)
+    assert parser.changed == [0, 1] and rendered == ["p\n\n", "r\n"]
+
+    rendered.clear()
+    edited = source.replace("r\n", "r edited\n")
+    assert parser.parse(edited) == parse_typst_exam(edited)
+    assert parser.changed == [1] and rendered == ["r edited\n"]
+    edited = "intro\n" + edited.replace("= second", "= new\n= second")
+    assert parser.parse(edited) == parse_typst_exam(edited)
+    assert parser.changed == [1] and rendered == ["r edited\n"]
+
+def test_jsonl_output(tmp_path):
+    source = tmp_path / "exam.typ"
+    source.write_text(example_typst_code)
+    code = f"import sys, typst_exam; sys.argv = ['typst_exam', '--no-cache', '--jsonl', {str(source)!r}]; typst_exam.main()"
+    lines = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.splitlines()
+    section, question = parse_typst_exam(example_typst_code)[0], parse_typst_exam(example_typst_code)[0]["questions"][0]
+    del section["questions"]
+    assert [json.loads(line) for line in lines] == [{"type": "section", **section}, {"type": "question", **question}, {"type": "end", "sections": 1, "questions": 1}]
+
+    # A file that fails to parse halfway leaves its records without the end record, and is not imported in part
+    from examtool.ir import ExamValidationError, read_exam
+    source.write_text(example_typst_code + "= second\n+ orphan\n")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    assert result.returncode != 0 and "option outside of a question" in result.stderr
+    assert result.stdout and '"type": "end"' not in result.stdout
+    with pytest.raises(ExamValidationError, match="the input ends without an end record"):
+        read_exam(io.StringIO(result.stdout))